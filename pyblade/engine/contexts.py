@@ -2,6 +2,8 @@ from ast import List
 from typing import Iterable
 from uuid import uuid4
 
+from .sandbox import TEMPLATE_GLOBALS, compile_expression
+
 
 class LoopContext:
     """Holds context information for loops."""
@@ -77,16 +79,16 @@ class AttributesContext:
             attributes = {key: value for key, value in attributes.items() if key not in self._exclude_keys}
 
         # Format the string representation of the attributes
-        string = ""
+        parts = []
         for key, value in attributes.items():
             if key not in self._props and isinstance(value, str):
-                string += f" {key}" + (f'="{value}"' if value != "" else "")
+                parts.append(f' {key}="{value}"' if value != "" else f" {key}")
 
         # Empty only and exclude keys
         self._only_keys = None
         self._exclude_keys = None
 
-        return string
+        return "".join(parts)
 
     def get(self, attr, default: str = ""):
         """
@@ -197,10 +199,9 @@ class SlotContext:
 
 class ClassContext:
     def __init__(self, attrs: dict, context: dict):
-        self._class = ""
-        for key, value in attrs.items():
-            if eval(str(value), {}, context):
-                self._class += f"{key} "
+        self._class = " ".join(
+            key for key, value in attrs.items() if eval(compile_expression(str(value)), TEMPLATE_GLOBALS, context)
+        )
 
     def __str__(self):
         return f'class="{self._class.strip()}"'
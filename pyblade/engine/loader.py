@@ -2,8 +2,10 @@
 Template file loading functionality.
 """
 
+import os
+import stat
 from pathlib import Path
-from typing import List, Optional, Union
+from typing import Dict, List, Optional, Tuple, Union
 
 from .exceptions import TemplateNotFoundError
 from .template import Template
@@ -20,7 +22,14 @@ class TemplateLoader:
             template_dirs: List of template directories
         """
         self._template_dirs = []
+        # The same directories as strings, to build template paths without creating Path objects
+        self._directory_names: List[str] = []
         self._extension = ".html"
+        # Maps template paths to their (modification time, size) and content, re-read only when the file changes
+        self._cache: Dict[str, Tuple[Tuple[int, int], str]] = {}
+        # Maps template names to the path they were found at, so that loading them again doesn't search
+        # every directory. A template later added to an earlier directory is only seen after clear_cache().
+        self._resolved: Dict[str, str] = {}
         if template_dirs:
             self.add_directories(template_dirs)
 
@@ -33,8 +42,10 @@ class TemplateLoader:
         """
         for directory in directories:
             path = Path(directory)
-            if path.is_dir():
+            # Directories are passed again on every load through load_template(), they are only searched once
+            if path.is_dir() and path not in self._template_dirs:
                 self._template_dirs.append(path)
+                self._directory_names.append(str(path))
 
     def load_template(self, template_name: str) -> Template:
         """
@@ -53,22 +64,31 @@ class TemplateLoader:
         # Remove extension if it exists
         template_name = template_name.removesuffix(self._extension)
 
+        # Templates found before are read from where they are, unless they were removed since
+        resolved = self._resolved.get(template_name)
+        if resolved is not None:
+            try:
+                return Template(template_name, resolved, self._read_template(resolved))
+            except (IOError, OSError):
+                del self._resolved[template_name]
+
         # Convert dot notation to path
-        template_path = template_name.replace(".", "/")
+        template_path = template_name.replace(".", "/") + self._extension
 
         # Search in all template directories
-        for directory in self._template_dirs:
-            full_path = directory / f"{template_path}{self._extension}"
+        for directory in self._directory_names:
+            full_path = os.path.join(directory, template_path)
             try:
                 content = self._read_template(full_path)
 
+                self._resolved[template_name] = full_path
                 return Template(template_name, full_path, content)
             except (IOError, OSError):
                 continue
 
         raise TemplateNotFoundError(f"{template_name}{self._extension}")
 
-    def _read_template(self, path: Path) -> str:
+    def _read_template(self, path: str) -> str:
         """
         Read a template file.
 
@@ -81,15 +101,52 @@ class TemplateLoader:
         Raises:
             IOError: If there's an error reading the file
         """
-        if not path.is_file():
+        try:
+            file_stat = os.stat(path)
+        except OSError as e:
+            raise IOError(f"Error reading template file {path}: {str(e)}")
+
+        if not stat.S_ISREG(file_stat.st_mode):
             raise IOError(f"Not a file: {path}")
 
+        version = (file_stat.st_mtime_ns, file_stat.st_size)
+        cached = self._cache.get(path)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+
         try:
-            with open(path, "r", encoding="utf-8") as f:
-                return f.read()
+            content = self._read_file(path, file_stat.st_size)
         except Exception as e:
             raise IOError(f"Error reading template file {path}: {str(e)}")
 
+        self._cache[path] = (version, content)
+        return content
+
+    @staticmethod
+    def _read_file(path: str, size: int) -> str:
+        """Read a whole UTF-8 file with as few system calls as its size allows, translating newlines like open()."""
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            chunks = []
+            while True:
+                # The file may have grown since it was stat'ed, so read until the end of file
+                chunk = os.read(fd, max(size, 4096))
+                if not chunk:
+                    break
+                chunks.append(chunk)
+        finally:
+            os.close(fd)
+
+        content = b"".join(chunks).decode("utf-8")
+        if "\r" in content:
+            content = content.replace("\r\n", "\n").replace("\r", "\n")
+        return content
+
+    def clear_cache(self) -> None:
+        """Forget every template read so far, so they are all searched and read again from disk."""
+        self._cache.clear()
+        self._resolved.clear()
+
 
 # Global loader instances
 _default_loader = TemplateLoader()
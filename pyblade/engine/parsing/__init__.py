@@ -6,6 +6,6 @@ This module contains the core parsing functionality for the PyBlade template eng
 from .directives import DirectiveParser
 from .template_processor import TemplateProcessor
 from .variables import VariableParser
-from .cache import TemplateCache
+from .cache import CompiledTemplateCache, TemplateCache
 
-__all__ = ['DirectiveParser', 'TemplateProcessor', 'VariableParser', 'TemplateCache']
+__all__ = ['DirectiveParser', 'TemplateProcessor', 'VariableParser', 'TemplateCache', 'CompiledTemplateCache']
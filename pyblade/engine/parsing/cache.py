@@ -2,9 +2,13 @@
 Template caching implementation for improved performance.
 """
 import hashlib
+import threading
+from collections import OrderedDict
 from typing import Dict, Optional, Any
 from datetime import datetime, timedelta
 
+from .nodes import CompiledTemplate
+
 
 class TemplateCache:
     """
@@ -96,3 +100,62 @@ class TemplateCache:
     def size(self) -> int:
         """Get the current number of cached templates."""
         return len(self._cache)
+
+
+class CompiledTemplateCache:
+    """
+    A bounded cache of compiled templates, keyed by their source.
+    Compiled templates do not depend on the context, so one entry serves every render of a template.
+    The least recently used entry is evicted when the cache is full.
+    It is safe to share between threads.
+
+    Python strings keep their hash once computed, so looking up a template that is rendered again
+    (as those of the template loader are) costs no pass over its source, unlike a digest of it.
+    """
+    def __init__(self, max_size: int = 512):
+        self._cache: "OrderedDict[str, CompiledTemplate]" = OrderedDict()
+        self._max_size = max_size
+        self._lock = threading.Lock()
+
+    def get(self, template: str) -> Optional[CompiledTemplate]:
+        """
+        Retrieve the compiled version of a template if it is cached.
+
+        Args:
+            template: The template string
+
+        Returns:
+            The compiled template or None if not found
+        """
+        with self._lock:
+            compiled = self._cache.get(template)
+            if compiled is not None:
+                self._cache.move_to_end(template)
+
+        return compiled
+
+    def set(self, template: str, compiled: CompiledTemplate) -> None:
+        """
+        Cache the compiled version of a template.
+
+        Args:
+            template: The template string
+            compiled: The compiled template
+        """
+        with self._lock:
+            self._cache[template] = compiled
+            self._cache.move_to_end(template)
+
+            # Enforce cache size limit
+            if len(self._cache) > self._max_size:
+                self._cache.popitem(last=False)
+
+    def clear(self) -> None:
+        """Clear all compiled templates."""
+        with self._lock:
+            self._cache.clear()
+
+    @property
+    def size(self) -> int:
+        """Get the current number of compiled templates."""
+        return len(self._cache)
@@ -3,51 +3,143 @@ Directive parsing implementation for the template engine.
 """
 
 import ast
+import bisect
 import html
 import importlib
 import json
 import keyword
 import re
+import sys
+import time
+from collections import ChainMap
 from datetime import datetime
+from functools import lru_cache
 from pprint import pformat, pprint  # noqa
-from typing import Any, Dict, Match, Pattern, Tuple
-from uuid import uuid4
+from types import CodeType
+from typing import Any, Callable, Dict, List, Match, Optional, Pattern, Set, Tuple, Type
 
 from pyblade.engine import loader
 
-from ..contexts import (
-    AttributesContext,
-    CycleContext,
-    ErrorMessageContext,
-    LoopContext,
-    SlotContext,
-)
+from ..contexts import AttributesContext, CycleContext, ErrorMessageContext, SlotContext
 from ..exceptions import (
     DirectiveParsingError,
     TemplateRenderingError,
     UndefinedVariableError,
 )
+from ..sandbox import TEMPLATE_GLOBALS, _fold_literal, compile_expression
+from .cache import CompiledTemplateCache
+from .nodes import (
+    AttributeDictNode,
+    AuthNode,
+    BreakNode,
+    ClassNode,
+    CompiledTemplate,
+    ContinueNode,
+    ForNode,
+    IfNode,
+    LoopTextNode,
+    Node,
+    PropsNode,
+    StyleNode,
+    SwitchNode,
+    TextNode,
+    UnlessNode,
+    VerbatimNode,
+    acquire_buffer,
+    release_buffer,
+    share_text,
+)
 from .variables import VariableParser
 
+_LINE_BREAK_PATTERN = re.compile(r"\n")
+
+# Shared by every parser, so that a template is compiled once per process instead of once per parser
+_COMPILE_CACHE = CompiledTemplateCache()
+
+# The last output of @now for each format, with the second it was formatted in
+_now_cache: Dict[str, Tuple[int, str]] = {}
+
+
+def _format_now(format_string: str) -> str:
+    """
+    Format the current time, once per second for each format.
+
+    Formats showing microseconds change more often, so they are never cached.
+    """
+    timestamp = time.time()
+    if "%f" in format_string:
+        return datetime.fromtimestamp(timestamp).strftime(format_string)
+
+    second = int(timestamp)
+    cached = _now_cache.get(format_string)
+    if cached is not None and cached[0] == second:
+        return cached[1]
+
+    # Formatted from the second itself, so the cached output matches the second it is kept for
+    formatted = datetime.fromtimestamp(second).strftime(format_string)
+    _now_cache[format_string] = (second, formatted)
+    return formatted
+
+
+class _CompileState:
+    """The progress of a single template compilation."""
+
+    def __init__(self, template: str):
+        self.template = template
+        self.position = 0
+        # Positions of every line break, to find the line of any position with a binary search
+        self.line_breaks = [match.start() for match in _LINE_BREAK_PATTERN.finditer(template)]
+        self.nodes: List[Node] = []
+        # The node list that text and directives are currently added to
+        self.body = self.nodes
+        # Open blocks, innermost last: (directive, line, node, current body)
+        self.stack: List[Tuple[str, int, Node, List[Node]]] = []
+        self.loop_depth = 0
+        # The last text node added, with the start and end of its text in the template
+        self.text_run: Optional[Tuple[TextNode, int, int]] = None
+        # Position of the next inline comment, searched again once the scan has moved past it
+        self.next_comment = template.find("{#")
+
+    def line_of(self, position: int) -> int:
+        """Get the line number of a position in the template."""
+        return bisect.bisect_left(self.line_breaks, position) + 1
+
+    @property
+    def top(self) -> Optional[str]:
+        """The innermost open block directive."""
+        return self.stack[-1][0] if self.stack else None
+
+    def open_block(self, directive: str, line: int, node: Node, body: List[Node]) -> None:
+        """Add a block node and continue inside its body."""
+        self.body.append(node)
+        self.stack.append((directive, line, node, body))
+        self.body = body
+
+    def switch_body(self, body: List[Node]) -> None:
+        """Continue inside another body of the innermost block, like an @else branch."""
+        self.stack[-1] = (*self.stack[-1][:3], body)
+        self.body = body
+
+    def close_block(self) -> Node:
+        """Close the innermost block and continue in its parent body."""
+        node = self.stack.pop()[2]
+        self.body = self.stack[-1][3] if self.stack else self.nodes
+        return node
+
 
 class DirectiveParser:
     """Handles parsing and processing of template directives."""
 
     # Cached regex patterns
     _ESCAPED_VAR_PATTERN: Pattern = re.compile(r"{{\s*(.*?)\s*}}")
-    _FOR_PATTERN: Pattern = re.compile(r"@for\s*\((.*?)\s+in\s+(.*?)\)\s*(.*?)(?:@empty\s*(.*?))?@endfor", re.DOTALL)
-    _IF_PATTERN: Pattern = re.compile(
-        r"@(if)\s*\((.*?\)?)\)\s*(.*?)\s*(?:@(elif)\s*\((.*?\)?)\)\s*(.*?))*(?:@(else)\s*(.*?))?@(endif)", re.DOTALL
-    )
-    _UNLESS_PATTERN: Pattern = re.compile(r"@unless\s*\((?P<expression>.*?)\)(?P<slot>.*?)@endunless", re.DOTALL)
-    _SWITCH_PATTERN: Pattern = re.compile(
-        r"@(?P<directive>switch|match)\s*\((?P<expression>.*?)\)\s*(?P<cases>.*?)@end(?P=directive)", re.DOTALL
-    )
-    _CASE_PATTERN: Pattern = re.compile(
-        r"@case\s*\((?P<value>.*?)\)\s*(?P<content>.*?)(?=@case|@default|@end(switch|match)|$)", re.DOTALL
-    )
-    _DEFAULT_PATTERN: Pattern = re.compile(r"@default\s*(?P<content>.*?)$", re.DOTALL)
-    _COMMENTS_PATTERN: Pattern = re.compile(r"{#(.*?)#}", re.DOTALL)
+    _DIRECTIVE_NAME_PATTERN: Pattern = re.compile(r"\w+")
+    # The name following each "@" of a template, possibly empty
+    _AT_NAME_PATTERN: Pattern = re.compile(r"@(\w*)")
+    # Template length from which one scan for all directive names costs less than searching each inline marker
+    _DIRECTIVE_SCAN_MIN_LENGTH = 1024
+    _WHITESPACE_PATTERN: Pattern = re.compile(r"\s*")
+    _ARGUMENT_DELIMITER_PATTERN: Pattern = re.compile(r"[()'\"]")
+    _FOR_ARGUMENTS_PATTERN: Pattern = re.compile(r"(?P<variable>.*?)\s+in\s+(?P<iterable>.*)", re.DOTALL)
 
     # New Django-like directive patterns
     _AUTOESCAPE_PATTERN: Pattern = re.compile(
@@ -58,7 +150,7 @@ class DirectiveParser:
     )
     _DEBUG_PATTERN: Pattern = re.compile(r"@debug", re.DOTALL)
 
-    _EXTENDS_PATTERN: Pattern = re.compile(r"(.*?)@extends\s*\(\s*[\"']?(.*?(?:\.?\.*?)*)[\"']?\s*\)", re.DOTALL)
+    _EXTENDS_PATTERN: Pattern = re.compile(r"@extends\s*\(\s*[\"']?(?P<layout>.*?)[\"']?\s*\)", re.DOTALL)
     _SECTION_PATTERN: Pattern = re.compile(
         r"@(?P<directive>section|block)\s*\((?P<section_name>[^)]*)\)\s*(?P<content>.*?)@end(?P=directive)", re.DOTALL
     )
@@ -81,8 +173,6 @@ class DirectiveParser:
         r"@regroup\s*\((?P<expression>.*?)\s+by\s+(?P<grouper>.*?)\s+as\s+(?P<var_name>.*?)\)", re.DOTALL
     )
     _SPACELESS_PATTERN: Pattern = re.compile(r"@spaceless\s*(?P<content>.*?)@endspaceless", re.DOTALL)
-    _STYLE_PATTERN: Pattern = re.compile(r"@style\s*\((?P<styles>.*?)\)", re.DOTALL)
-    _CLASS_PATTERN: Pattern = re.compile(r"@class\s*\((?P<classes>.*?)\)", re.DOTALL)
     _TEMPLATETAG_PATTERN: Pattern = re.compile(r"@templatetag\s*\((?P<tag>.*?)\)", re.DOTALL)
     _WIDTHRATIO_PATTERN: Pattern = re.compile(
         r"@widthratio\s*\((?P<value>.*?)\s*,\s*(?P<max_value>.*?)\s*,\s*(?P<max_width>.*?)\)", re.DOTALL
@@ -91,8 +181,6 @@ class DirectiveParser:
         r"@with\s*\((?P<expression>.*?)\s*as\s*(?P<variable>.*?)\)\s*(?P<content>.*?)\s*@endwith", re.DOTALL
     )
     _COMMENT_PATTERN: Pattern = re.compile(r"@comment\s*(?P<content>.*?)@endcomment", re.DOTALL)
-    _VERBATIM_PATTERN: Pattern = re.compile(r"@verbatim\s*(?P<content>.*?)@endverbatim", re.DOTALL)
-    _VERBATIM_SHORTHAND_PATTERN: Pattern = re.compile(r"@(?P<content>{{.*?}})", re.DOTALL)
     _VERBATIM_PLACEHOLDER_PATTERN: Pattern = re.compile(r"@__verbatim__\((?P<id>\w+)\)", re.DOTALL)
     _CSRF_PATTERN: Pattern = re.compile(r"@csrf", re.DOTALL)
     _METHOD_PATTERN: Pattern = re.compile(r"@method\s*\(\s*(?P<method>.*?)\s*\)", re.DOTALL)
@@ -100,9 +188,21 @@ class DirectiveParser:
         r"@(?P<directive>checked|selected|required|disabled|readonly|multiple|autofocus|autocomplete)\s*(?:\(\s*(?P<expression>.*?)\s*\))?",  # noqa
         re.DOTALL,
     )
+    # Output of each conditional attribute directive, indexed by whether its condition holds
+    _CONDITIONAL_ATTRIBUTE_OUTPUTS: Dict[str, Tuple[str, str]] = {
+        **{
+            name: ("", name)
+            for name in ("checked", "selected", "required", "disabled", "readonly", "multiple", "autofocus")
+        },
+        "autocomplete": ("off", "on"),
+    }
     _COMPONENT_PATTERN: Pattern = re.compile(
         r"@component\s*\(\s*(?P<name>.*?)\s*(?:,\s*(?P<data>.*?))?\s*\)(?P<slot>.*?)", re.DOTALL
     )
+    _COMPONENT_ATTRIBUTE_PATTERN: Pattern = re.compile(
+        r"(?P<attribute>:?\w+)(?:\s*=\s*(?P<value>[\"']?.*?[\"']))?", re.DOTALL
+    )
+    _PROPS_PATTERN: Pattern = re.compile(r"@props\s*\((?P<dictionary>.*?)\s*\)", re.DOTALL)
     _SLOT_PATTERN: Pattern = re.compile(r"@slot\s*\((?P<name>.*?)\)(?P<content>\s*.*?\s*)@endslot", re.DOTALL)
     _SLOT_SHORTHAND_PATTERN: Pattern = re.compile(r"@slot\((?P<name>.*?)\s*,\s*(?P<content>.*?)\)", re.DOTALL)
     _SLOT_TAG_PATTERN: Pattern = re.compile(
@@ -119,6 +219,34 @@ class DirectiveParser:
     _ERROR_PATTERN: Pattern = re.compile(r"@error\s*\((?P<field>.*?)\s*\)\s*(?P<slot>.*?)\s*@enderror", re.DOTALL)
     _OPENING_TAG_PATTERN: Pattern = re.compile(r"<(?P<tag>\w+)\s*(?P<attributes>.*?)>")
 
+    _URL_PATTERN: Pattern = re.compile(
+        r"@url\s*\(\s*(?P<pattern>['\"].*?['\"])\s*(?:,\s*(?P<params>.*?))?\s*(?:\s+as\s+(?P<as_var>\w+))?\s*\)",
+        re.DOTALL,
+    )
+    _YIELD_PATTERN: Pattern = re.compile(r"@yield\s*\(\s*(?P<yieldable_name>.*?)\s*\)", re.DOTALL)
+    _PYBLADE_TAG_PATTERN: Pattern = re.compile(
+        r"<b-(?P<component>\w+-?\w+)\s*(?P<attributes>.*?)\s*(?:/>|>(?P<slot>.*?)</b-(?P=component)>)", re.DOTALL
+    )
+    _STATIC_PATTERN: Pattern = re.compile(r"@static\s*\(\s*(?P<path>.*?)\s*\)", re.DOTALL)
+    _ACTIVE_PATTERN: Pattern = re.compile(r"@active\((?P<route>.*?)(?:,(?P<param>.*?))?\)", re.DOTALL)
+    _TRANSLATE_PATTERN: Pattern = re.compile(
+        r"@(?:trans|translate)\(\s*(?P<text>'[^']+'|\"[^\"]+\")\s*"
+        r"(?:,\s*context\s*=\s*(?P<context>'[^']+'|\"[^\"]+\"))?\s*\)",
+        re.DOTALL,
+    )
+    _BLOCKTRANSLATE_PATTERN: Pattern = re.compile(
+        r"@blocktranslate(?:\s+count\s+(?P<count>\w+))?\s*\{(?P<block>.*?)@endblocktranslate\}", re.DOTALL
+    )
+    _PLURAL_PATTERN: Pattern = re.compile(r"(?P<singular>.*)@plural\s*(?P<plural>.*)", re.DOTALL)
+
+    # Patterns of the rendered content
+    _HTML_TAG_PATTERN: Pattern = re.compile(r"<(/)?(\w+)[^>]*>")
+    _HTML_COMMENT_PATTERN: Pattern = re.compile(r"<!--.*?-->", re.DOTALL)
+    _WHITESPACE_RUN_PATTERN: Pattern = re.compile(r"\s+")
+    _NAME_SEPARATOR_PATTERN: Pattern = re.compile(r"[-_]")
+    # Valid Python variable names: a letter or underscore, then only letters, numbers and underscores
+    _VARIABLE_NAME_PATTERN: Pattern = re.compile(r"^[a-zA-Z_][a-zA-Z0-9_]*$")
+
     # Bootstrap directive patterns
     _BOOTSTRAP_CSS_PATTERN: Pattern = re.compile(r"@bootstrap_css", re.DOTALL)
     _BOOTSTRAP_JS_PATTERN: Pattern = re.compile(r"@bootstrap_javascript", re.DOTALL)
@@ -127,6 +255,29 @@ class DirectiveParser:
     _TAILWIND_CSS_PATTERN: Pattern = re.compile(r"@tailwind_css", re.DOTALL)
     _TAILWIND_PRELOAD_CSS_PATTERN: Pattern = re.compile(r"@tailwind_preload_css", re.DOTALL)
 
+    # Whitespace dropped around the body of each block directive: (leading, trailing)
+    _BODY_STRIP: Dict[str, Tuple[bool, bool]] = {
+        "if": (True, True),
+        "auth": (True, True),
+        "guest": (True, True),
+        "anonymous": (True, True),
+        "for": (True, False),
+        "switch": (True, False),
+        "match": (True, False),
+        "unless": (False, False),
+    }
+
+    # Kinds of the tokens found by the compiler's scanner that are not block directives
+    _COMMENT_TOKEN = "{#"
+    _SHORTHAND_TOKEN = "@{{"
+
+    # Nesting depth from which generated render code calls nodes instead of inlining them, far below
+    # the indentation limit of the Python parser
+    _MAX_EMITTED_DEPTH = 24
+
+    # Largest exponent a constant expression may use and still be evaluated at compile time
+    _MAX_FOLDED_POWER = 100
+
     def __init__(self):
         self._context: Dict[str, Any] = {}
         self._line_map: Dict[str, int] = {}  # Maps directive positions to line numbers
@@ -138,25 +289,6 @@ class DirectiveParser:
         """Get the line number for a position in the template."""
         return self.initial_template.count("\n", 0, match.start()) + 1
 
-    def _check_unclosed_tags(self, template: str) -> None:
-        """Check for unclosed directive tags and report their line numbers."""
-        # Define pairs of opening and closing tags
-        tag_pairs = {"@if": "@endif", "@for": "@endfor", "@unless": "@endunless", "@switch": "@endswitch"}
-
-        for start_tag, end_tag in tag_pairs.items():
-            # Find all occurrences of start tags
-            start_positions = [m.start() for m in re.finditer(re.escape(start_tag), template)]
-            end_positions = [m.start() for m in re.finditer(re.escape(end_tag), template)]
-
-            if len(start_positions) > len(end_positions):
-                # Find the first unclosed tag
-                for pos in start_positions:
-                    # Count matching end tags before this position
-                    matching_ends = sum(1 for end_pos in end_positions if end_pos > pos)
-                    if matching_ends < 1:
-                        line_number = 0  # TODO: use regex match
-                        raise DirectiveParsingError(f"Unclosed {start_tag} directive at line {line_number}")
-
     def parse_directives(self, template: str, context: Dict[str, Any]) -> str:
         """
         Process all directives within a template.
@@ -169,239 +301,866 @@ class DirectiveParser:
             The processed template
         """
         self._context = context
-        self._check_unclosed_tags(template)
+
+        # Block directives are compiled once into a tree of nodes, then rendered with the given context
+        compiled = _COMPILE_CACHE.get(template)
+        if compiled is None:
+            compiled = self.compile(template)
+            _COMPILE_CACHE.set(template, compiled)
+        template = compiled.render(context)
 
         # Process slots first to ensure they're captured before component rendering
         # template = self._process_slots(template, context)
 
-        # Process directives in order
-        template = self._parse_comments(template)
-        template = self._parse_verbatim_shorthand(template)
-        template = self._parse_verbatim(template)
-        template = self._parse_for(template)
-        template = self._parse_if(template)
-        template = self._parse_switch(template)
-        template = self._parse_unless(template)
-        template = self._parse_auth(template)
-        template = self._parse_guest(template)
-        template = self._parse_anonymous(template)
-        template = self._parse_class(template)
-        template = self._parse_style(template)
-        template = self._parse_active(template)
+        # Process inline directives in order, skipping those the template does not contain.
+        # In long templates, the names following an "@" are collected in a single scan instead of searching each
+        # marker, and that scan is done again only once a pass changed the template.
+        names = None
+        for marker, parse in self._INLINE_PASSES:
+            if marker is not None:
+                if marker[0] != "@" or len(template) < self._DIRECTIVE_SCAN_MIN_LENGTH:
+                    if marker not in template:
+                        continue
+                else:
+                    if names is None:
+                        names = self._directive_prefixes(template)
+                    if marker[1:] not in names:
+                        continue
 
-        # Form helpers
-        template = self._parse_csrf(template)
-        template = self._parse_method(template)
-        template = self._parse_conditional_attributes(template)
-        template = self._parse_field(template)
-        template = self._parse_error(template)
+            processed = parse(self, template)
+            if processed is not template:
+                template = processed
+                names = None
 
-        # Components related
-        # Parse slots first to ensure they're captured before any component rendering
-        template = self._parse_slot_tags(template)
-        template = self._parse_pyblade_tags(template)
-        template = self._parse_component(template)
-        template = self._parse_include(template)
-        template = self._parse_extends(template)
+        return template
 
-        # Django-like directives
-        template = self._parse_static(template)
-        template = self._parse_now(template)
-        template = self._parse_cycle(template)
-        template = self._parse_debug(template)
-        template = self._parse_filter(template)
-        template = self._parse_firstof(template)
-        template = self._parse_ifchanged(template)
-        template = self._parse_lorem(template)
-        template = self._parse_querystring(template)
-        template = self._parse_regroup(template)
-        template = self._parse_spaceless(template)
-        template = self._parse_templatetag(template)
-        template = self._parse_widthratio(template)
-        template = self._parse_with(template)
-        template = self._parse_component(template)
-        template = self._parse_url(template)
-        template = self._parse_autoescape(template)
+    @classmethod
+    def _directive_prefixes(cls, template: str) -> Set[str]:
+        """
+        Collect every prefix of the names following an "@" in a template.
 
-        # Process liveblade
-        template = self._parse_liveblade_scripts(template)
-        template = self._parse_liveblade(template)
+        An "@name" marker appears in the template exactly when "name" is in the result, "@" alone included.
+        """
+        return {
+            name[:length] for name in set(cls._AT_NAME_PATTERN.findall(template)) for length in range(len(name) + 1)
+        }
 
-        # Process Bootstrap directives
-        template = self._process_bootstrap_css(template, context)
-        template = self._process_bootstrap_javascript(template, context)
+    def compile(self, template: str) -> CompiledTemplate:
+        """
+        Compile the block directives of a template into a tree of nodes.
 
-        # Process Tailwind directives
-        template = self._process_tailwind_preload_css(template, context)
-        template = self._process_tailwind_css(template, context)
+        The structure of the template is validated here, in a single pass, so rendering the compiled
+        template never has to check for unclosed blocks again.
 
-        # Restore verbatim content
-        template = self._restore_verbatim(template)
+        Args:
+            template: The template string
 
-        return template
+        Returns:
+            The compiled template
 
-    def _parse_for(self, template: str) -> str:
-        """Process @for loops with @empty fallback."""
-        return self._FOR_PATTERN.sub(self._handle_for, template)
+        Raises:
+            DirectiveParsingError: If a block directive is malformed or left unclosed
+        """
+        state = _CompileState(template)
+
+        while True:
+            token = self._scan(state)
+            if token is None:
+                break
+
+            start, end, directive = token
+            self._append_text(state, state.position, start)
+            state.position = end
+
+            if directive == self._COMMENT_TOKEN:
+                # Inline comments are dropped, an unterminated one is kept as text
+                comment_end = template.find("#}", end)
+                if comment_end == -1:
+                    self._append_text(state, start, end)
+                else:
+                    state.position = comment_end + 2
+                continue
 
-    def _handle_for(self, match: Match) -> str:
-        """Handle @for loop logic with proper error handling."""
-        try:
-            variable = self._validate_variable_name(match.group(1).strip())
-            iterable_expression = match.group(2).strip()
-            block = match.group(3)
-            empty_block = match.group(4)
+            if directive == self._SHORTHAND_TOKEN:
+                # @{{ }} shorthands are kept as is
+                shorthand_start = start + 1
+                state.body.append(VerbatimNode(template[shorthand_start:end]))
+                continue
 
-            try:
-                iterable = eval(iterable_expression, {}, self._context)
-            except Exception as e:
-                raise DirectiveParsingError(f"Error evaluating iterable expression '{iterable_expression}': {str(e)}")
+            # Interned so that the names kept on the block stack and in nodes are shared by every template
+            directive = sys.intern(directive)
+            line = state.line_of(start)
+            if not self._BLOCK_HANDLERS[directive](self, state, directive, line):
+                # Not a block directive in this position, leave it to the inline directives
+                self._append_text(state, start, end)
 
-            if not iterable:
-                return empty_block if empty_block else ""
+        self._append_text(state, state.position, len(template))
 
-            result = []
-            current_loop = self._context.get("loop")
-            loop = LoopContext(iterable, parent=current_loop)
+        if state.stack:
+            directive, line = state.stack[-1][:2]
+            raise DirectiveParsingError(f"Unclosed @{directive} directive at line {line}")
 
-            for index, item in enumerate(iterable):
-                loop.index = index
+        return self._compile_template(state.nodes)
 
-                self._context.update({variable: item, "loop": loop})
+    def _scan(self, state: "_CompileState") -> Optional[Tuple[int, int, str]]:
+        """
+        Find the next block directive, inline comment or @{{ }} shorthand from the current position.
 
-                parsed_block = self.parse_directives(block, self._context)
-                parsed_block = self._variable_parser.parse_variables(block, self._context)
+        Only the places where an "@" or a "{#" appears are inspected, the text between them is skipped at once.
 
-                should_break, parsed_block = self._parse_break(parsed_block, self._context)
-                should_continue, parsed_block = self._parse_continue(parsed_block, self._context)
+        Returns:
+            The start and end of the token, with its directive name or token kind, or None if there is none left
+        """
+        template = state.template
+        position = state.position
+        if -1 < state.next_comment < position:
+            state.next_comment = template.find("{#", position)
+
+        while True:
+            at = template.find("@", position)
+            comment = state.next_comment
+            if comment != -1 and (at == -1 or comment < at):
+                return comment, comment + 2, self._COMMENT_TOKEN
+            if at == -1:
+                return None
+
+            if template.startswith("{{", at + 1):
+                end = template.find("}}", at + 3)
+                if end != -1:
+                    return at, end + 2, self._SHORTHAND_TOKEN
+            else:
+                name = self._DIRECTIVE_NAME_PATTERN.match(template, at + 1)
+                if name is not None and name.group() in self._BLOCK_HANDLERS:
+                    return at, name.end(), name.group()
 
-                if should_break:
-                    break
-                if should_continue:
-                    continue
+            position = at + 1
 
-                result.append(parsed_block)
+    @staticmethod
+    def _strip_inline_comments(template: str) -> str:
+        """Remove the {# #} comments of a template, jumping from one delimiter to the next with str.find."""
+        start = template.find("{#")
+        if start == -1:
+            return template
+
+        parts = []
+        position = 0
+        while start != -1:
+            end = template.find("#}", start + 2)
+            if end == -1:
+                break
+            parts.append(template[position:start])
+            position = end + 2
+            start = template.find("{#", position)
+        parts.append(template[position:])
+        return "".join(parts)
+
+    # Block directive handlers. Each one returns False when its directive is not valid where it was found.
+
+    def _handle_raw_block(self, state: "_CompileState", directive: str, line: int) -> bool:
+        """Handle @verbatim and @comment, whose content is never parsed."""
+        end = state.template.find(f"@end{directive}", state.position)
+        if end == -1:
+            raise DirectiveParsingError(f"Unclosed @{directive} directive at line {line}")
+
+        start = state.position
+        if directive == "verbatim":
+            state.body.append(VerbatimNode(state.template[start:end].lstrip()))
+        state.position = end + len(f"@end{directive}")
+        return True
+
+    def _handle_if(self, state: "_CompileState", directive: str, line: int) -> bool:
+        arguments = self._read_arguments(state, directive, line, optional=True)
+        if arguments is None:
+            # Not a directive, like in an e-mail address
+            return False
 
-            self._context.pop("loop")
-            return "".join(result)
+        node = IfNode()
+        state.open_block(directive, line, node, node.add_branch(arguments))
+        return True
 
-        except Exception as e:
-            raise DirectiveParsingError(f"Error in @for directive: {str(e)}")
+    def _handle_elif(self, state: "_CompileState", directive: str, line: int) -> bool:
+        if state.top != "if" or state.stack[-1][2].else_nodes is not None:
+            return False
 
-    def _parse_if(self, template: str) -> str:
-        """Process @if, @elif, and @else directives."""
+        arguments = self._read_arguments(state, directive, line, optional=True)
+        if arguments is None:
+            return False
 
-        def replace_if(match: Match) -> str:
-            try:
-                captures = [group for group in match.groups()]
+        self._strip_body(state.body, "if")
+        state.switch_body(state.stack[-1][2].add_branch(arguments))
+        return True
 
-                for i, capture in enumerate(captures[:-1]):
-                    if capture in ("if", "elif", "else"):
-                        if capture in ("if", "elif"):
-                            if eval(captures[i + 1], {}, self._context):
-                                return captures[i + 2]
-                        else:
-                            return captures[i + 1]
+    def _handle_else(self, state: "_CompileState", directive: str, line: int) -> bool:
+        if state.top not in ("if", "auth", "guest", "anonymous"):
+            return False
 
-            except Exception as e:
-                raise DirectiveParsingError(f"Error in @if directive: {str(e)}")
+        self._strip_body(state.body, state.top)
+        node = state.stack[-1][2]
+        node.else_nodes = []
+        state.switch_body(node.else_nodes)
+        return True
 
-        return self._IF_PATTERN.sub(replace_if, template)
+    def _handle_unless(self, state: "_CompileState", directive: str, line: int) -> bool:
+        arguments = self._read_arguments(state, directive, line, optional=True)
+        if arguments is None:
+            return False
 
-    def _parse_unless(self, template: str) -> str:
-        """Process @unless directives."""
+        node = UnlessNode(arguments)
+        state.open_block(directive, line, node, node.nodes)
+        return True
 
-        def replace_unless(match: Match) -> str:
-            try:
-                expression = match.group("expression")
-                slot = match.group("slot")
+    def _handle_for(self, state: "_CompileState", directive: str, line: int) -> bool:
+        arguments = self._read_arguments(state, directive, line, optional=True)
+        if arguments is None:
+            return False
 
-                try:
-                    condition = eval(expression, {}, self._context)
-                except Exception as e:
-                    raise DirectiveParsingError(f"Error evaluating unless condition '{expression}': {str(e)}")
+        node = self._compile_for(arguments, line)
+        state.open_block(directive, line, node, node.nodes)
+        state.loop_depth += 1
+        return True
 
-                return "" if condition else slot
+    def _handle_empty(self, state: "_CompileState", directive: str, line: int) -> bool:
+        if state.top != "for":
+            return False
 
-            except Exception as e:
-                raise DirectiveParsingError(f"Error in @unless directive: {str(e)}")
+        self._strip_body(state.body, "for")
+        node = state.stack[-1][2]
+        node.empty_nodes = []
+        state.switch_body(node.empty_nodes)
+        return True
 
-        return self._UNLESS_PATTERN.sub(replace_unless, template)
+    def _handle_loop_control(self, state: "_CompileState", directive: str, line: int) -> bool:
+        """Handle @break and @continue, which are only meaningful inside a loop."""
+        if not state.loop_depth:
+            return False
 
-    def _parse_switch(self, template: str) -> str:
-        """Process @switch, @case, and @default directives."""
+        arguments = self._read_arguments(state, directive, line, optional=True)
+        state.body.append(BreakNode(arguments) if directive == "break" else ContinueNode(arguments))
 
-        def replace_switch(match: Match) -> str:
-            try:
-                expression = match.group("expression")
-                cases_block = match.group("cases")
+        # The loop catching the signal is the innermost one whose body, not its @empty branch, is being compiled
+        for _, _, node, body in reversed(state.stack):
+            if isinstance(node, ForNode) and body is node.nodes:
+                node.interruptible = True
+                break
+        return True
+
+    def _handle_switch(self, state: "_CompileState", directive: str, line: int) -> bool:
+        arguments = self._read_arguments(state, directive, line, optional=True)
+        if arguments is None:
+            return False
+
+        # Anything before the first @case is discarded
+        state.open_block(directive, line, SwitchNode(arguments), [])
+        return True
+
+    def _handle_case(self, state: "_CompileState", directive: str, line: int) -> bool:
+        if state.top not in ("switch", "match"):
+            return False
+
+        arguments = self._read_arguments(state, directive, line, optional=True)
+        if arguments is None:
+            return False
+
+        self._strip_body(state.body, state.top)
+        state.switch_body(state.stack[-1][2].add_case(arguments))
+        return True
+
+    def _handle_default(self, state: "_CompileState", directive: str, line: int) -> bool:
+        if state.top not in ("switch", "match"):
+            return False
+
+        self._strip_body(state.body, state.top)
+        node = state.stack[-1][2]
+        node.default_nodes = []
+        state.switch_body(node.default_nodes)
+        return True
+
+    def _handle_auth(self, state: "_CompileState", directive: str, line: int) -> bool:
+        """Handle @auth, @guest and @anonymous, which take no arguments and are only blocks when closed later on."""
+        if state.template.find(f"@end{directive}", state.position) == -1:
+            # Not a directive, like in an e-mail address
+            return False
+
+        node = AuthNode(directive)
+        state.open_block(directive, line, node, node.nodes)
+        return True
+
+    def _handle_props(self, state: "_CompileState", directive: str, line: int) -> bool:
+        arguments = self._read_arguments(state, directive, line, optional=True)
+        if arguments is None:
+            return False
 
-                # Evaluate the switch expression
+        state.body.append(self._compile_props(arguments, line))
+        return True
+
+    def _handle_attribute_dict(self, state: "_CompileState", directive: str, line: int) -> bool:
+        """Handle @class and @style, whose dictionary is split into its entries once, here."""
+        arguments = self._read_arguments(state, directive, line, optional=True)
+        if arguments is None:
+            # Not a directive, like in an e-mail address
+            return False
+
+        node_class = ClassNode if directive == "class" else StyleNode
+        conditions = self._attribute_conditions(arguments)
+        if conditions is None:
+            state.body.append(node_class(arguments))
+            return True
+
+        node = node_class(arguments, self._compile_attribute_entries(conditions, node_class))
+        # An attribute whose conditions are all constants is rendered once, here
+        attribute = self._fold_attribute(arguments, conditions, node)
+        if attribute is None:
+            state.body.append(node)
+        elif attribute:
+            state.body.append(TextNode(attribute))
+        return True
+
+    def _handle_end(self, state: "_CompileState", directive: str, line: int) -> bool:
+        """Handle the closing directive of a block."""
+        top = state.top
+        if top is None:
+            raise DirectiveParsingError(f"Mismatched @{directive} at line {line}: no open @{directive[3:]} directive")
+        if top != directive[3:]:
+            raise DirectiveParsingError(
+                f"Mismatched @{directive} at line {line}: expected @end{top} "
+                f"for the @{top} directive at line {state.stack[-1][1]}"
+            )
+
+        self._strip_body(state.body, top)
+        node = state.close_block()
+        folded = None
+        if top == "for":
+            state.loop_depth -= 1
+            node.specialize()
+            self._compile_for_loop(node)
+        elif isinstance(node, IfNode):
+            folded = self._fold_if(node)
+        elif isinstance(node, SwitchNode):
+            self._build_jump_table(node)
+            folded = self._fold_switch(node)
+
+        # A block whose outcome is already known is replaced by the nodes it would render, spliced in its parent
+        if folded is not None:
+            state.body[-1:] = folded
+        return True
+
+    _BLOCK_HANDLERS: Dict[str, Callable[..., bool]] = {
+        "verbatim": _handle_raw_block,
+        "comment": _handle_raw_block,
+        "if": _handle_if,
+        "elif": _handle_elif,
+        "else": _handle_else,
+        "unless": _handle_unless,
+        "for": _handle_for,
+        "empty": _handle_empty,
+        "break": _handle_loop_control,
+        "continue": _handle_loop_control,
+        "switch": _handle_switch,
+        "match": _handle_switch,
+        "case": _handle_case,
+        "default": _handle_default,
+        "auth": _handle_auth,
+        "guest": _handle_auth,
+        "anonymous": _handle_auth,
+        "props": _handle_props,
+        "class": _handle_attribute_dict,
+        "style": _handle_attribute_dict,
+        **dict.fromkeys(
+            (
+                "endif",
+                "endunless",
+                "endfor",
+                "endswitch",
+                "endmatch",
+                "endauth",
+                "endguest",
+                "endanonymous",
+                "endverbatim",
+                "endcomment",
+            ),
+            _handle_end,
+        ),
+    }
+
+    def _read_arguments(
+        self, state: "_CompileState", directive: str, line: int, optional: bool = False
+    ) -> Optional[str]:
+        """Read the arguments of the directive at the current position, and move past them."""
+        arguments, state.position = self._scan_arguments(state.template, state.position, directive, line, optional)
+        return arguments
+
+    def _compile_for(self, arguments: str, line: int) -> ForNode:
+        """Build a @for node from its '<variable> in <iterable>' arguments."""
+        match = self._FOR_ARGUMENTS_PATTERN.match(arguments)
+        if not match:
+            raise DirectiveParsingError(f"Invalid @for directive at line {line}: expected '<variable> in <iterable>'")
+
+        variable = match.group("variable").strip()
+        iterable = match.group("iterable").strip()
+
+        if "," in variable or variable.startswith(("(", "[")):
+            target = self._compile_for_target(variable, line)
+            namespace: Dict[str, Any] = {}
+            exec(f"def bind(context, value):\n    {target} = value\n", {"__builtins__": {}}, namespace)
+            return ForNode(variable, iterable, namespace["bind"], target)
+
+        try:
+            variable = self._validate_variable_name(variable)
+        except ValueError as e:
+            raise DirectiveParsingError(f"Error in @for directive: {str(e)}")
+
+        return ForNode(variable, iterable)
+
+    def _compile_for_target(self, target: str, line: int) -> str:
+        """
+        Build the assignment target unpacking each item of a loop into its variables, like '(key, value)'.
+
+        The target structure is resolved once here, so every iteration is a single unpacking assignment.
+        """
+        try:
+            tree = ast.parse(target, mode="eval").body
+        except SyntaxError:
+            raise DirectiveParsingError(f"Invalid @for directive at line {line}: invalid loop variables '{target}'")
+
+        def assignment_target(node: ast.AST) -> str:
+            if isinstance(node, ast.Name):
                 try:
-                    switch_value = eval(expression, {}, self._context)
-                except Exception as e:
-                    raise DirectiveParsingError(f"Error evaluating switch expression '{expression}': {str(e)}")
+                    return f"context[{self._validate_variable_name(node.id)!r}]"
+                except ValueError as e:
+                    raise DirectiveParsingError(f"Error in @for directive: {str(e)}")
+            if isinstance(node, ast.Starred):
+                return f"*{assignment_target(node.value)}"
+            if isinstance(node, (ast.Tuple, ast.List)):
+                return f"({', '.join(assignment_target(element) for element in node.elts)},)"
+            raise DirectiveParsingError(f"Invalid @for directive at line {line}: invalid loop variables '{target}'")
+
+        return assignment_target(tree)
+
+    def _compile_for_loop(self, node: ForNode) -> None:
+        """
+        Generate the function running the iterations of a loop.
+
+        Each iteration is then plain bytecode assigning the loop variables and rendering the body as a flat
+        sequence of writes: static texts and the segments of loop texts are written directly, and only the
+        other nodes are called through their render method.
+        An iteration that @break or @continue can interrupt outputs nothing when it is, so its writes are
+        collected in a buffer, taken from the pool of output buffers, and joined into a single write once it
+        completes.
+        """
+        if node.interruptible:
+            lines = [
+                "def run(context, iterable, loop, output):",
+                "    iteration = acquire_buffer()",
+                "    write = iteration.append",
+            ]
+        else:
+            lines = ["def run(context, iterable, loop, write):"]
 
-                # Find all cases
-                cases = self._CASE_PATTERN.finditer(cases_block)
-                default_match = self._DEFAULT_PATTERN.search(cases_block)
+        lines += [
+            "    for index, value in enumerate(iterable):",
+            "        loop.index = index",
+            "        context['loop'] = loop",
+        ]
+        if node.bind is None:
+            lines.append(f"        {node.target} = value")
+        else:
+            lines += [
+                "        try:",
+                f"            {node.target} = value",
+                "        except (TypeError, ValueError) as e:",
+                "            raise unpack_error(e)",
+            ]
+
+        namespace = self._code_namespace()
+        namespace["unpack_error"] = node.unpack_error
+
+        if node.interruptible:
+            namespace["break_loop"] = BreakNode.signal
+            namespace["continue_loop"] = ContinueNode.signal
+            namespace["acquire_buffer"] = acquire_buffer
+            namespace["release_buffer"] = release_buffer
+            lines += [
+                "        del iteration[:]",
+                "        try:",
+            ]
+            self._emit_nodes(node.nodes, namespace, lines, 3)
+            lines += [
+                "        except break_loop:",
+                "            break",
+                "        except continue_loop:",
+                "            continue",
+                "        if iteration:",
+                "            output(''.join(iteration))",
+                "    release_buffer(iteration)",
+            ]
+        else:
+            self._emit_nodes(node.nodes, namespace, lines, 2)
 
-                # Check each case
-                for case in cases:
-                    case_value = case.group("value")
-                    try:
-                        case_result = eval(case_value, {}, self._context)
-                    except Exception as e:
-                        raise DirectiveParsingError(f"Error evaluating case value '{case_value}': {str(e)}")
+        node.run = self._define_function(lines, namespace)
 
-                    if case_result == switch_value:
-                        return self.parse_directives(case.group("content"), self._context)
+    def _compile_template(self, nodes: List[Node]) -> CompiledTemplate:
+        """
+        Build a compiled template whose top-level nodes are rendered by a single generated function.
 
-                # If no case matched and there's a default, use it
-                if default_match:
-                    return self.parse_directives(default_match.group("content"), self._context)
+        Its code is a flat sequence of writes, with the @if, @unless and @switch blocks turned into Python
+        if statements, so rendering it only calls into the other nodes.
+        """
+        lines = ["def run(context, write):"]
+        namespace = self._code_namespace()
+        self._emit_nodes(nodes, namespace, lines, 1)
 
-                return ""
+        return CompiledTemplate(nodes, self._define_function(lines, namespace))
 
-            except Exception as e:
-                raise DirectiveParsingError(f"Error in @switch directive: {str(e)}")
+    @staticmethod
+    def _code_namespace() -> Dict[str, Any]:
+        """Create the namespace of a generated render function, which only needs a few builtins."""
+        return {
+            "__builtins__": {
+                "enumerate": enumerate,
+                "Exception": Exception,
+                "TypeError": TypeError,
+                "ValueError": ValueError,
+            },
+        }
+
+    def _emit_nodes(self, nodes: List[Node], namespace: Dict[str, Any], lines: List[str], indent: int) -> None:
+        """
+        Append the code rendering a list of nodes to a generated function.
+
+        Static texts and the segments of loop texts are written directly, @if, @unless and @switch blocks
+        become if statements (up to a nesting depth Python can compile), and the other nodes are called
+        through their render method.
+        Every object the code uses is stored in the namespace under a name of its own.
+        """
+        pad = "    " * indent
+        if not nodes:
+            lines.append(f"{pad}pass")
+            return
+
+        for child in nodes:
+            if type(child) is TextNode:
+                lines.append(f"{pad}write({self._bind(namespace, child.text)})")
+            elif type(child) is LoopTextNode:
+                for segment in child.segments:
+                    if isinstance(segment, str):
+                        lines.append(f"{pad}write({self._bind(namespace, segment)})")
+                    else:
+                        lines.append(f"{pad}write({self._bind(namespace, segment.render)}(context))")
+            elif type(child) is IfNode and indent < self._MAX_EMITTED_DEPTH:
+                self._emit_if(child, namespace, lines, indent)
+            elif type(child) is UnlessNode and indent < self._MAX_EMITTED_DEPTH:
+                self._emit_unless(child, namespace, lines, indent)
+            elif type(child) is SwitchNode and indent < self._MAX_EMITTED_DEPTH:
+                self._emit_switch(child, namespace, lines, indent)
+            else:
+                lines.append(f"{pad}{self._bind(namespace, child.render)}(context, write)")
 
-        return self._SWITCH_PATTERN.sub(replace_switch, template)
+    def _emit_if(self, node: IfNode, namespace: Dict[str, Any], lines: List[str], indent: int) -> None:
+        """
+        Append the code of an @if block to a generated function.
 
-    def _parse_comments(self, template: str) -> str:
-        """Process both inline comments ({# #}) and block comments (@comment)."""
-        # First process inline comments
-        template = self._COMMENTS_PATTERN.sub("", template)
+        The conditions are evaluated first, in order and only until one holds, so that their errors are
+        reported like IfNode does, without catching those of the selected branch.
+        """
+        pad = "    " * indent
+        selection = " else ".join(
+            f"{index} if {self._bind(namespace, expression.evaluate)}(context)"
+            for index, (expression, _) in enumerate(node.branches)
+        )
+        lines += [
+            f"{pad}try:",
+            f"{pad}    branch = {selection} else -1",
+            f"{pad}except Exception as e:",
+            f"{pad}    raise {self._bind(namespace, node.condition_error)}(e)",
+        ]
 
-        # Then process block comments
-        def replace_comment(match: Match) -> str:
+        for index, (_, nodes) in enumerate(node.branches):
+            lines.append(f"{pad}{'if' if index == 0 else 'elif'} branch == {index}:")
+            self._emit_nodes(nodes, namespace, lines, indent + 1)
+        if node.else_nodes is not None:
+            lines.append(f"{pad}else:")
+            self._emit_nodes(node.else_nodes, namespace, lines, indent + 1)
+
+    def _emit_unless(self, node: UnlessNode, namespace: Dict[str, Any], lines: List[str], indent: int) -> None:
+        """Append the code of an @unless block to a generated function."""
+        pad = "    " * indent
+        lines += [
+            f"{pad}try:",
+            f"{pad}    condition = {self._bind(namespace, node.expression.evaluate)}(context)",
+            f"{pad}except Exception as e:",
+            f"{pad}    raise {self._bind(namespace, node.condition_error)}(e)",
+            f"{pad}if not condition:",
+        ]
+        self._emit_nodes(node.nodes, namespace, lines, indent + 1)
+
+    def _emit_switch(self, node: SwitchNode, namespace: Dict[str, Any], lines: List[str], indent: int) -> None:
+        """
+        Append the code of a @switch block to a generated function.
+
+        The switch selects the index of its branch, through its jump table when it has one, and the code
+        jumps to that branch.
+        """
+        pad = "    " * indent
+        lines.append(f"{pad}branch = {self._bind(namespace, node.select)}(context)")
+
+        branches = [nodes for _, nodes in node.cases]
+        if node.default_nodes is not None:
+            branches.append(node.default_nodes)
+        for index, nodes in enumerate(branches):
+            lines.append(f"{pad}{'if' if index == 0 else 'elif'} branch == {index}:")
+            self._emit_nodes(nodes, namespace, lines, indent + 1)
+
+    @staticmethod
+    def _define_function(lines: List[str], namespace: Dict[str, Any]) -> Callable[..., None]:
+        """
+        Define the generated "run" function whose code is in the given lines.
+
+        The objects bound in its namespace are passed as defaults of keyword-only parameters, so that its code,
+        loop bodies included, reads them as local variables instead of looking them up as globals.
+        """
+        bound = [name for name in namespace if name[1:].isdigit()]
+        if bound:
+            lines[0] = f"{lines[0][:-2]}, *, {', '.join(f'{name}={name}' for name in bound)}):"
+        exec("\n".join(lines) + "\n", namespace)
+        return namespace["run"]
+
+    @staticmethod
+    def _bind(namespace: Dict[str, Any], value: Any) -> str:
+        """Store a value in the namespace of a generated function and return the name it can use."""
+        name = f"_{len(namespace)}"
+        namespace[name] = value
+        return name
+
+    @staticmethod
+    @lru_cache(maxsize=256)
+    def _compile_props(arguments: str, line: int) -> PropsNode:
+        """
+        Build a @props node. Literal defaults are evaluated once, here, instead of on every render.
+
+        Nodes are cached by their arguments, so components rendered again reuse the defaults of the first render.
+        """
+        try:
+            defaults = ast.literal_eval(arguments)
+        except (ValueError, TypeError, SyntaxError):
             try:
-                return ""  # Remove the comment and its content
-            except Exception as e:
-                raise DirectiveParsingError(f"Error in comment directive: {str(e)}")
+                return PropsNode(code=compile(arguments, "<props>", "eval"))
+            except SyntaxError as e:
+                raise DirectiveParsingError(f"Invalid @props directive at line {line}: {e.msg}")
+
+        if not isinstance(defaults, dict):
+            raise DirectiveParsingError(f"Invalid @props directive at line {line}: expected a dictionary")
+        return PropsNode(defaults=defaults)
+
+    @staticmethod
+    def _attribute_conditions(arguments: str) -> Optional[Dict[str, ast.expr]]:
+        """
+        Read the keys and conditions of a @class or @style dictionary literal.
+
+        Returns:
+            The condition of each key, or None when the arguments are not a dictionary literal with string keys
+        """
+        try:
+            tree = ast.parse(arguments, mode="eval").body
+        except SyntaxError:
+            return None
+
+        if not isinstance(tree, ast.Dict):
+            return None
 
-        return self._COMMENT_PATTERN.sub(replace_comment, template)
+        # Later duplicates override earlier ones, like in the dictionary itself
+        conditions: Dict[str, ast.expr] = {}
+        for key, value in zip(tree.keys, tree.values):
+            if not (isinstance(key, ast.Constant) and isinstance(key.value, str)):
+                return None
+            conditions[key.value] = value
+        return conditions
 
-    def _parse_verbatim(self, template: str) -> str:
+    @staticmethod
+    def _compile_attribute_entries(
+        conditions: Dict[str, ast.expr], node_class: Type[AttributeDictNode]
+    ) -> List[Tuple[str, CodeType]]:
+        """Compile the conditions of a @class or @style dictionary literal, along with their cleaned keys."""
+        return [
+            (node_class.clean_key(key), compile(ast.Expression(value), "<template>", "eval"))
+            for key, value in conditions.items()
+            if node_class.clean_key(key)
+        ]
+
+    def _fold_attribute(
+        self, arguments: str, conditions: Dict[str, ast.expr], node: AttributeDictNode
+    ) -> Optional[str]:
+        """
+        Render a @class or @style attribute at compile time, when all its conditions are boolean constants.
+
+        Returns:
+            The attribute, empty when no condition holds, or None when it depends on the context
         """
-        Process both @verbatim blocks and shorthand verbatim (@{{ }}).
-        The shorthand is processed first to prevent interference with block processing.
+        keys = []
+        for key, value in conditions.items():
+            # Conditions that are not booleans are evaluated again at render time, with the context
+            is_constant, holds = _fold_literal(
+                ast.get_source_segment(arguments, value) or "", self._MAX_FOLDED_POWER, with_names=False
+            )
+            if not is_constant or not isinstance(holds, bool):
+                return None
+            if holds and node.clean_key(key):
+                keys.append(node.clean_key(key))
+
+        return node.format(keys) if keys else ""
+
+    def _build_jump_table(self, node: SwitchNode) -> None:
         """
+        Let a switch find its case with a single lookup, for the cases whose values are constants.
 
-        def replace_verbatim(match: Match) -> str:
+        Only the cases before the first one depending on the context can be looked up, as the first
+        matching case wins. The following ones are still compared one by one.
+        """
+        jump_table: Dict[Any, int] = {}
+        jump_end = 0
+
+        for case_value, _ in node.cases:
+            is_constant, value = _fold_literal(case_value.source, self._MAX_FOLDED_POWER, with_names=False)
+            if not is_constant:
+                break
             try:
-                verbatim_content = match.group("content")
+                # The first matching case wins, as with a linear scan
+                jump_table.setdefault(value, jump_end)
+            except TypeError:
+                # Unhashable case values can only be compared with the switch value
+                break
+            jump_end += 1
+
+        if jump_end:
+            node.jump_table = jump_table
+            node.jump_end = jump_end
+
+    def _fold_if(self, node: IfNode) -> Optional[List[Node]]:
+        """
+        Drop the branches of an @if block whose condition is a constant.
 
-                verbatim_id = uuid4().hex
-                self._context.setdefault("__verbatims", {})[verbatim_id] = verbatim_content
-                return f"@__verbatim__({verbatim_id})"
+        Returns:
+            The nodes to render in place of the whole block, when its outcome is known at compile time
+        """
+        branches = []
+        for expression, nodes in node.branches:
+            is_constant, value = _fold_literal(expression.source, self._MAX_FOLDED_POWER, with_names=False)
+            if not is_constant:
+                branches.append((expression, nodes))
+            elif value:
+                # The following branches can never be reached, this one becomes the fallback
+                node.else_nodes = nodes
+                break
+
+        node.branches = branches
+        if branches:
+            return None
+        return node.else_nodes if node.else_nodes is not None else []
+
+    def _fold_switch(self, node: SwitchNode) -> Optional[List[Node]]:
+        """
+        Select the branch of a switch on a constant among constant cases.
 
-            except Exception as e:
-                raise DirectiveParsingError(f"Error in @verbatim directive: {str(e)}")
+        Returns:
+            The nodes to render in place of the whole block, when its outcome is known at compile time
+        """
+        if node.jump_table is None:
+            return None
 
-        template = self._VERBATIM_SHORTHAND_PATTERN.sub(replace_verbatim, template)
+        is_constant, value = _fold_literal(node.expression.source, self._MAX_FOLDED_POWER, with_names=False)
+        if not is_constant:
+            return None
 
-        return self._VERBATIM_PATTERN.sub(replace_verbatim, template)
+        try:
+            index = node.jump_table.get(value)
+        except TypeError:
+            return None
+
+        if index is not None:
+            return node.cases[index][1]
+        if node.jump_end < len(node.cases):
+            # One of the remaining cases may still match at render time
+            return None
+        return node.default_nodes if node.default_nodes is not None else []
+
+    def _scan_arguments(
+        self, template: str, position: int, directive: str, line: int, optional: bool = False
+    ) -> Tuple[Optional[str], int]:
+        """
+        Read the parenthesized arguments of a directive, honoring nested parentheses and string literals.
+
+        Args:
+            template: The template string
+            position: The position right after the directive name
+            directive: The directive name, for error messages
+            line: The line of the directive, for error messages
+            optional: Whether the directive may have no arguments at all
+
+        Returns:
+            The stripped arguments (or None) and the position right after the closing parenthesis
+        """
+        opening = self._WHITESPACE_PATTERN.match(template, position).end()
+
+        if opening == len(template) or template[opening] != "(":
+            if optional:
+                return None, position
+            raise DirectiveParsingError(f"Missing arguments for @{directive} directive at line {line}")
+
+        depth = 0
+        quote = None
+        start = opening + 1
+        # Only parentheses and quotes matter, the characters between them are skipped at once
+        for delimiter in self._ARGUMENT_DELIMITER_PATTERN.finditer(template, opening):
+            index = delimiter.start()
+            char = delimiter.group()
+            if quote:
+                if char == quote and template[index - 1] != "\\":
+                    quote = None
+            elif char in ("'", '"'):
+                quote = char
+            elif char == "(":
+                depth += 1
+            elif char == ")":
+                depth -= 1
+                if depth == 0:
+                    return template[start:index].strip(), index + 1
+
+        raise DirectiveParsingError(f"Unclosed parenthesis in @{directive} directive at line {line}")
+
+    def _append_text(self, state: "_CompileState", start: int, end: int) -> None:
+        """Add a slice of static text to the current body. Text in loops resolves its variables on each iteration."""
+        if start == end:
+            return
+
+        body = state.body
+        if state.text_run is not None and body and body[-1] is state.text_run[0] and state.text_run[2] == start:
+            # Text following the previous text node directly, like a directive kept as text, extends it
+            start = state.text_run[1]
+            body.pop()
+
+        text = share_text(state.template[start:end])
+        if state.loop_depth:
+            node: TextNode = LoopTextNode(text, state.line_of(start))
+        else:
+            node = TextNode(text)
+        body.append(node)
+        state.text_run = (node, start, end)
+
+    def _strip_body(self, body: List[Node], directive: str) -> None:
+        """Drop the whitespace surrounding a block body, as configured for its directive."""
+        leading, trailing = self._BODY_STRIP[directive]
+
+        if leading and body and isinstance(body[0], TextNode):
+            body[0] = self._replace_text(body[0], body[0].text.lstrip())
+        if trailing and body and isinstance(body[-1], TextNode):
+            body[-1] = self._replace_text(body[-1], body[-1].text.rstrip())
+
+    def _replace_text(self, node: TextNode, text: str) -> TextNode:
+        """Rebuild a text node around a stripped version of its text."""
+        text = share_text(text)
+        if isinstance(node, LoopTextNode):
+            # Whitespace stripped from the start moves the text down by the lines it contained
+            return LoopTextNode(text, node.line + node.text.count("\n", 0, node.text.find(text)))
+        return TextNode(text)
 
     def _restore_verbatim(self, template: str) -> str:
         """
@@ -435,7 +1194,7 @@ class DirectiveParser:
                         value = value.strip()
                         try:
                             # Evaluate the value in the current context
-                            evaluated_value = eval(value, {}, self._context)
+                            evaluated_value = eval(compile_expression(value), TEMPLATE_GLOBALS, self._context)
                             url_params.append((key, evaluated_value))
                         except Exception as e:
                             raise DirectiveParsingError(f"Error evaluating URL parameter '{value}': {str(e)}")
@@ -446,14 +1205,21 @@ class DirectiveParser:
                 raise DirectiveParsingError("URL configuration not found in context")
 
             try:
-                # Resolve URL pattern
-                from django.urls import reverse
+                from django.urls import get_script_prefix, get_urlconf
+                from django.utils.translation import get_language
 
-                url = reverse(
-                    url_pattern,
-                    args=[p[1] for p in url_params if not p[0]],
-                    kwargs={p[0]: p[1] for p in url_params if p[0]},
-                )
+                # Resolve URL pattern
+                args = tuple(p[1] for p in url_params if not p[0])
+                kwargs = tuple(sorted((p[0], p[1]) for p in url_params if p[0]))
+                # The URLs reversed also depend on the URL configuration, script prefix and language of the thread
+                url_state = (get_urlconf(), get_script_prefix(), get_language())
+                try:
+                    hash((url_pattern, args, kwargs, url_state))
+                except TypeError:
+                    # Unhashable parameters can't be cached
+                    url = self._reverse_url.__wrapped__(url_pattern, args, kwargs, url_state)
+                else:
+                    url = self._reverse_url(url_pattern, args, kwargs, url_state)
 
                 # If 'as' variable is specified, store in context and return empty string
                 if as_var:
@@ -464,94 +1230,24 @@ class DirectiveParser:
             except Exception as e:
                 raise DirectiveParsingError(f"Error resolving URL '{url_pattern}': {str(e)}")
 
-        # Updated pattern to support 'as' variable assignment
-        url_pattern = re.compile(
-            r"@url\s*\(\s*(?P<pattern>['\"].*?['\"])\s*(?:,\s*(?P<params>.*?))?\s*(?:\s+as\s+(?P<as_var>\w+))?\s*\)",
-            re.DOTALL,
-        )
-
-        return url_pattern.sub(replace_url, template)
-
-    def _parse_break(self, template: str, context: Dict[str, Any]) -> Tuple[bool, str]:
-        """Process @break directives."""
-        pattern = re.compile(r"@break(?:\s*\(\s*(?P<expression>.*?)\s*\))?", re.DOTALL)
-        match = pattern.search(template)
-
-        if match:
-            template = pattern.sub("", template)
-            expression = match.group("expression")
-            if not expression:
-                return True, template
-            try:
-                if eval(expression, {}, context):
-                    return True, template
-            except Exception as e:
-                raise DirectiveParsingError(f"Error in @break directive: {str(e)}")
-        return False, template
-
-    def _parse_continue(self, template: str, context: Dict[str, Any]) -> Tuple[bool, str]:
-        """Process @continue directives."""
-        pattern = re.compile(r"@continue(?:\s*\(\s*(?P<expression>.*?)\s*\))?", re.DOTALL)
-        match = pattern.search(template)
-
-        if match:
-            template = pattern.sub("", template)
-            expression = match.group("expression")
-            if not expression:
-                return True, template
-            try:
-                if eval(expression, {}, context):
-                    return True, template
-            except Exception as e:
-                raise DirectiveParsingError(f"Error in @continue directive: {str(e)}")
-        return False, template
+        return self._URL_PATTERN.sub(replace_url, template)
 
-    def _parse_auth_or_guest(self, template):
-        """
-        Generalized method to parse @auth or @guest directives.
+    @staticmethod
+    @lru_cache(maxsize=4096)
+    def _reverse_url(
+        url_pattern: str, args: Tuple[Any, ...], kwargs: Tuple[Tuple[str, Any], ...], url_state: Tuple[Any, ...]
+    ) -> str:
         """
+        Reverse a URL once for each pattern, parameters and URL state.
 
-        def handle_auth_or_guest(match):
-            """
-            Generalized handler for @auth and @guest directives.
-            """
-            directive = match.group("directive")
-
-            is_authenticated = False
-            request = self._context.get("request", None)
-            if request:
-                try:
-                    is_authenticated = request.user.is_authenticated
-                except Exception as e:
-                    raise Exception(str(e))
-
-            should_render_first_block = is_authenticated if directive == "auth" else not is_authenticated
-
-            captures = [group for group in match.groups() if group not in (None, "")]
-            for i, capture in enumerate(captures[:-1]):
-                if capture == directive:
-                    if should_render_first_block:
-                        return captures[i + 1]
-                elif capture == "else":
-                    if not should_render_first_block:
-                        return captures[i + 1]
-
-        pattern = re.compile(
-            r"@(?P<directive>auth|guest|anonymous)\s*(.*?)\s*(?:@(else)\s*(.*?))?\s*@end(?P=directive)", re.DOTALL
-        )
-        return pattern.sub(lambda match: handle_auth_or_guest(match), template)
-
-    def _parse_auth(self, template):
-        """Check if the user is authenticated."""
-        return self._parse_auth_or_guest(template)
-
-    def _parse_guest(self, template):
-        """Check if the user is not authenticated."""
-        return self._parse_auth_or_guest(template)
+        The state holds the URL configuration, script prefix and active language of the current thread,
+        which reverse() reads on its own, so that a URL is cached for each of them.
+        Call ``DirectiveParser._reverse_url.cache_clear()`` after changing the URL patterns themselves,
+        in tests for example.
+        """
+        from django.urls import reverse
 
-    def _parse_anonymous(self, template):
-        """Check if the user is not authenticated. Same as @guest"""
-        return self._parse_auth_or_guest(template)
+        return reverse(url_pattern, args=list(args), kwargs=dict(kwargs))
 
     def _parse_include(self, template: str) -> str:
         """
@@ -601,13 +1297,14 @@ class DirectiveParser:
 
         # Get the first (and should be only) match
         match = extends_matches[0] if extends_matches else None
-        template = re.sub(self._EXTENDS_PATTERN, "", template)
 
         if match:
-            if match.group(1):
+            if match.start():
                 raise DirectiveParsingError("The @extends tag must be at the top of the file before any character.")
 
-            layout_name = match.group(2) if match else None
+            body_start = match.end()
+            template = template[body_start:]
+            layout_name = match.group("layout")
             if not layout_name:
                 raise DirectiveParsingError("Missing layout name in @extends directive")
 
@@ -644,7 +1341,7 @@ class DirectiveParser:
             return ""
 
         sections = {}
-        template = re.sub(self._SECTION_PATTERN, handle_section, template)
+        template = self._SECTION_PATTERN.sub(handle_section, template)
 
         self._context["slot"] = SlotContext(template.strip())
 
@@ -657,8 +1354,7 @@ class DirectiveParser:
         :param layout:
         :return:
         """
-        pattern = re.compile(r"@yield\s*\(\s*(?P<yieldable_name>.*?)\s*\)", re.DOTALL)
-        return pattern.sub(lambda match: self._handle_yield(match, sections), layout)
+        return self._YIELD_PATTERN.sub(lambda match: self._handle_yield(match, sections), layout)
 
     def _handle_yield(self, match, sections: Dict[str, str] = None):
         yieldable_name = self._validate_variable_name(match.group("yieldable_name"))
@@ -683,29 +1379,20 @@ class DirectiveParser:
         return template
 
     def _parse_pyblade_tags(self, template):
-        pattern = re.compile(
-            r"<b-(?P<component>\w+-?\w+)\s*(?P<attributes>.*?)\s*(?:/>|>(?P<slot>.*?)</b-(?P=component)>)", re.DOTALL
-        )
-        return pattern.sub(lambda match: self._handle_pyblade_tags(match), template)
+        return self._PYBLADE_TAG_PATTERN.sub(lambda match: self._handle_pyblade_tags(match), template)
 
     def _handle_pyblade_tags(self, match):
         component_name = match.group("component")
         component = loader.load_template(f"components.{component_name}")
 
-        attr_string = match.group("attributes")
-        attr_pattern = re.compile(r"(?P<attribute>:?\w+)(?:\s*=\s*(?P<value>[\"']?.*?[\"']))?", re.DOTALL)
-        attrs = attr_pattern.findall(attr_string)
-
         attributes = {}
         component_context = {}
 
-        for attr in attrs:
-            name, value = attr
-            value = value[1:-1]
+        for name, value in self._split_component_attributes(match.group("attributes")):
             if name.startswith(":"):
                 name = name[1:]
                 try:
-                    value = eval(value, {}, self._context) if value else None
+                    value = eval(compile_expression(value), TEMPLATE_GLOBALS, self._context) if value else None
                 except NameError as e:
                     raise e
 
@@ -725,22 +1412,38 @@ class DirectiveParser:
         parsed_component = component.render(component_context)
         return parsed_component
 
+    @staticmethod
+    @lru_cache(maxsize=256)
+    def _split_component_attributes(attr_string: str) -> Tuple[Tuple[str, str], ...]:
+        """Split the attributes of a component tag into names and unquoted values, once for each tag."""
+        return tuple(
+            (name, value[1:-1]) for name, value in DirectiveParser._COMPONENT_ATTRIBUTE_PATTERN.findall(attr_string)
+        )
+
     def _parse_props(self, component: str) -> tuple:
-        pattern = re.compile(r"@props\s*\((?P<dictionary>.*?)\s*\)", re.DOTALL)
-        match = pattern.search(component)
+        component, props_node = self._strip_props(component)
+        props = props_node.resolve(self._context) if props_node is not None else {}
+        return component, props
 
-        props = {}
-        if match:
-            component = re.sub(pattern, "", component)
-            dictionary = match.group("dictionary")
-            try:
-                props = eval(dictionary, {}, self._context)
-            except SyntaxError as e:
-                raise e
-            except ValueError as e:
-                raise e
+    @staticmethod
+    @lru_cache(maxsize=128)
+    def _strip_props(component: str) -> Tuple[str, Optional[PropsNode]]:
+        """
+        Remove the @props directive of a component, once for each version of its content.
 
-        return component, props
+        Returns:
+            The component without @props, and the compiled @props node if there was one
+        """
+        if "@props" not in component:
+            return component, None
+
+        match = DirectiveParser._PROPS_PATTERN.search(component)
+        if not match:
+            return component, None
+
+        line = component.count("\n", 0, match.start()) + 1
+        props_node = DirectiveParser._compile_props(match.group("dictionary"), line)
+        return DirectiveParser._PROPS_PATTERN.sub("", component), props_node
 
     def _parse_component(self, template: str) -> str:
         """Process @component directive for reusable template components."""
@@ -755,7 +1458,7 @@ class DirectiveParser:
                 component_context = {}
                 if data:
                     try:
-                        component_context = eval(data, {}, self._context)
+                        component_context = eval(compile_expression(data), TEMPLATE_GLOBALS, self._context)
                     except Exception as e:
                         raise DirectiveParsingError(f"Error processing component data: {str(e)}")
 
@@ -771,97 +1474,6 @@ class DirectiveParser:
 
         return self._COMPONENT_PATTERN.sub(replace_component, template)
 
-    def _parse_class(self, template: str) -> str:
-        """
-        Process @class directives to conditionally apply HTML classes.
-
-        Example:
-            @class({'active': isActive, 'disabled': isDisabled})
-
-        Args:
-            template: The template string
-
-        Returns:
-            The processed template with class attributes
-        """
-
-        def replace_class(match: Match) -> str:
-            try:
-                # Get the classes dictionary from the directive
-                classes_str = match.group("classes").strip()
-
-                # Evaluate the dictionary using eval for consistency with style directive
-                classes_dict = eval(classes_str, {}, self._context)
-
-                if not isinstance(classes_dict, dict):
-                    raise DirectiveParsingError("@class directive requires a dictionary")
-
-                active_classes = []
-                for class_name, condition in classes_dict.items():
-                    # Evaluate the condition if it's not already a boolean
-                    if not isinstance(condition, bool):
-                        condition = eval(str(condition), {}, self._context)
-
-                    if condition:
-                        # Clean up class name, removing quotes and extra spaces
-                        clean_class = class_name.strip().strip("\"'")
-                        if clean_class:
-                            active_classes.append(clean_class)
-
-                # If we have active classes, return them as a class attribute
-                if active_classes:
-                    return f' class="{" ".join(active_classes)}"'
-                return ""
-
-            except Exception as e:
-                raise DirectiveParsingError(f"Error in @class directive: {str(e)}")
-
-        return self._CLASS_PATTERN.sub(replace_class, template)
-
-    def _parse_style(self, template: str) -> str:
-        """
-        Process @style directives to conditionally apply inline styles.
-
-        Example:
-            @style({'color: red;': isError, 'font-weight: bold;': isBold})
-
-        Args:
-            template: The template string
-
-        Returns:
-            The processed template with style attributes
-        """
-
-        def replace_style(match: Match) -> str:
-            try:
-                # Get the styles dictionary from the directive
-                styles_str = match.group("styles").strip()
-
-                styles_dict = eval(styles_str, {}, self._context)
-
-                if not isinstance(styles_dict, dict):
-                    raise DirectiveParsingError("@style directive requires a dictionary")
-
-                active_styles = []
-                for style, condition in styles_dict.items():
-                    if not isinstance(condition, bool):
-                        condition = eval(str(condition), {}, self._context)
-
-                    if condition:
-                        # Remove any existing 'style="' or '"' from the style string
-                        clean_style = style.strip().rstrip(";").strip("\"'")
-                        if clean_style:
-                            active_styles.append(clean_style)
-
-                if active_styles:
-                    return f' style="{"; ".join(active_styles)};"'
-                return ""
-
-            except Exception as e:
-                raise DirectiveParsingError(f"Error in @style directive: {str(e)}")
-
-        return self._STYLE_PATTERN.sub(replace_style, template)
-
     def _parse_autoescape(self, template: str) -> str:
         """Process @autoescape directive for controlling HTML escaping."""
 
@@ -872,7 +1484,7 @@ class DirectiveParser:
 
                 mode = True if str(mode) in ("on", "True") else False
                 if not mode:
-                    return re.sub(self._ESCAPED_VAR_PATTERN, r"{!! \1 !!}", content)
+                    return self._ESCAPED_VAR_PATTERN.sub(r"{!! \1 !!}", content)
 
                 return content
 
@@ -893,24 +1505,10 @@ class DirectiveParser:
                 if alias and str(alias) != " as ":
                     raise DirectiveParsingError("Syntax error in @cycle directive: alias must be ' as '")
 
-                # Parse the values
-                values = []
-                for val in values_str.split(","):
-                    val = val.strip().strip("'\"")
-                    if val:
-                        if val in self._context.keys():
-                            values.append(f"{{{{ {val} }}}}")
-                            continue
-                        values.append(val)
-
+                values = self._split_cycle_values(values_str)
                 if not values:
                     raise DirectiveParsingError("Cycle values cannot be empty")
 
-                # Initialize cycle tracking in context if not exists
-                self._context.setdefault("__cycle_vars__", {})
-
-                # If this is not a named cycle
-
                 # Check if this is a reference to an existing cycle
                 # if len(values) == 1:
                 #     if isinstance(values[0], CycleContext):
@@ -920,16 +1518,20 @@ class DirectiveParser:
                 #         return cycle.current
 
                 cycle_key = var_name or values_str
+                cycles = self._context.setdefault("__cycle_vars__", {})
 
-                cycle = self._context.get("__cycle_vars__").get(cycle_key, CycleContext(values, values_str))
+                # A cycle is created the first time it is reached, its values are read from then on
+                cycle = cycles.get(cycle_key)
+                if cycle is None:
+                    cycle = cycles[cycle_key] = CycleContext(
+                        [f"{{{{ {value} }}}}" if value in self._context else value for value in values], values_str
+                    )
                 current_value = cycle.current
 
                 # If this is a named cycle, store the variable in the context
                 if var_name:
                     self._context[var_name] = current_value
 
-                # Store current value in context for direct access
-                self._context["__cycle_vars__"].setdefault(cycle_key, cycle)
                 cycle.index += 1
                 return current_value
 
@@ -939,6 +1541,13 @@ class DirectiveParser:
         content = self._CYCLE_PATTERN.sub(replace_cycle, template)
         return content
 
+    @staticmethod
+    @lru_cache(maxsize=256)
+    def _split_cycle_values(values: str) -> Tuple[str, ...]:
+        """Split the values of a @cycle directive, without their quotes, once for each list of values."""
+        stripped = (value.strip().strip("'\"") for value in values.split(","))
+        return tuple(value for value in stripped if value)
+
     def _parse_debug(self, template: str) -> str:
         """Process @debug directive to output debugging information."""
 
@@ -984,14 +1593,16 @@ class DirectiveParser:
     def _parse_firstof(self, template: str) -> str:
         """Process @firstof directive to output the first non-empty value."""
 
+        context = self._context
+
         def replace_firstof(match: Match) -> str:
             try:
-                values = [v.strip() for v in match.group("values").split(",")]
                 default = match.group("default")
 
-                for value in values:
+                # Values are evaluated one at a time, until one of them is not empty
+                for is_constant, value in self._compile_firstof(match.group("values")):
                     try:
-                        result = eval(value, {}, self._context)
+                        result = value if is_constant else eval(value, TEMPLATE_GLOBALS, context)
                         if result:
                             return str(result)
                     except Exception:
@@ -1003,6 +1614,22 @@ class DirectiveParser:
 
         return self._FIRSTOF_PATTERN.sub(replace_firstof, template)
 
+    @staticmethod
+    @lru_cache(maxsize=256)
+    def _compile_firstof(values: str) -> Tuple[Tuple[bool, Any], ...]:
+        """
+        Split the values of a @firstof directive, once for each list of values.
+
+        Returns:
+            For each value, whether it is a constant and its value, or False and its compiled expression
+        """
+        compiled = []
+        for value in values.split(","):
+            value = value.strip()
+            is_constant, constant = _fold_literal(value, DirectiveParser._MAX_FOLDED_POWER, with_names=False)
+            compiled.append((True, constant) if is_constant else (False, compile_expression(value)))
+        return tuple(compiled)
+
     def _parse_ifchanged(self, template: str) -> str:
         """Process @ifchanged directive to conditionally output content if it has changed."""
 
@@ -1021,7 +1648,10 @@ class DirectiveParser:
 
                 if expressions:
                     # Watch for changes in specific variables
-                    current_values = tuple(eval(expr.strip(), {}, self._context) for expr in expressions.split(","))
+                    current_values = tuple(
+                        eval(compile_expression(expr.strip()), TEMPLATE_GLOBALS, self._context)
+                        for expr in expressions.split(",")
+                    )
                 else:
                     # Watch for changes in the rendered content
                     current_values = (self.parse_directives(content, self._context),)
@@ -1113,7 +1743,7 @@ class DirectiveParser:
                 if alias and str(alias) != " as ":
                     raise DirectiveParsingError("Syntax error in @now directive: alias must be ' as '")
 
-                now = datetime.now().strftime(format_string)
+                now = _format_now(format_string)
                 if var_name:
                     self._context[var_name] = now
 
@@ -1128,27 +1758,21 @@ class DirectiveParser:
         """Process @querystring directive to modify URL query parameters."""
         from urllib.parse import parse_qs, urlencode
 
+        # The current query string is parsed once, when the first directive is found, and shared by all of them
+        current: List[Dict[str, List[str]]] = []
+
         def replace_querystring(match: Match) -> str:
             try:
-                updates_str = match.group("updates")
-
-                # Get current query string from context
-                current_query = self._context.get("request", {}).GET.urlencode()
-                query_dict = parse_qs(current_query)
-
-                if updates_str:
-                    # Parse and apply updates
-                    updates = {}
-                    for pair in updates_str.split(","):
-                        key, value = pair.split("=")
-                        updates[key.strip()] = value.strip().strip("'\"")
-
-                    # Update query parameters
-                    for key, value in updates.items():
-                        if value == "None":
-                            query_dict.pop(key, None)
-                        else:
-                            query_dict[key] = [value]
+                if not current:
+                    current.append(parse_qs(self._context.get("request", {}).GET.urlencode()))
+                query_dict = dict(current[0])
+
+                # Update query parameters
+                for key, value in self._split_querystring_updates(match.group("updates") or ""):
+                    if value == "None":
+                        query_dict.pop(key, None)
+                    else:
+                        query_dict[key] = [value]
 
                 return "?" + urlencode(query_dict, doseq=True)
             except Exception as e:
@@ -1156,6 +1780,20 @@ class DirectiveParser:
 
         return self._QUERYSTRING_PATTERN.sub(replace_querystring, template)
 
+    @staticmethod
+    @lru_cache(maxsize=256)
+    def _split_querystring_updates(updates: str) -> Tuple[Tuple[str, str], ...]:
+        """Split the key=value updates of a @querystring directive, once for each list of updates."""
+        if not updates:
+            return ()
+
+        # Later updates of a key replace earlier ones
+        pairs = {}
+        for pair in updates.split(","):
+            key, value = pair.split("=")
+            pairs[key.strip()] = value.strip().strip("'\"")
+        return tuple(pairs.items())
+
     def _parse_regroup(self, template: str) -> str:
         """Process @regroup directive to group a list of dictionaries by a common attribute."""
         from itertools import groupby
@@ -1167,15 +1805,21 @@ class DirectiveParser:
                 var_name = match.group("var_name")
 
                 # Evaluate the expression to get the list
-                items = eval(expression, {}, self._context)
-
-                # Sort items by the grouper
-                items = sorted(items, key=lambda x: eval(grouper, {}, {"item": x}))
-
-                # Group items
+                items = list(eval(compile_expression(expression), TEMPLATE_GLOBALS, self._context))
+
+                # Evaluate the grouper once for each item, reusing the same scope
+                grouper_code = compile_expression(grouper)
+                scope: Dict[str, Any] = {}
+                keys = []
+                for item in items:
+                    scope["item"] = item
+                    keys.append(eval(grouper_code, TEMPLATE_GLOBALS, scope))
+
+                # Sort items by the grouper, then group the consecutive ones sharing it
+                order = sorted(range(len(items)), key=keys.__getitem__)
                 groups = []
-                for key, group in groupby(items, key=lambda x: eval(grouper, {}, {"item": x})):
-                    groups.append({"grouper": key, "list": list(group)})
+                for key, indexes in groupby(order, key=keys.__getitem__):
+                    groups.append({"grouper": key, "list": [items[index] for index in indexes]})
 
                 # Store result in context
                 self._context[var_name] = groups
@@ -1191,7 +1835,7 @@ class DirectiveParser:
         def replace_spaceless(match: Match) -> str:
             try:
                 content = match.group("content")
-                return re.sub(r"\s+", "", content)
+                return self._WHITESPACE_RUN_PATTERN.sub("", content)
             except Exception as e:
                 raise DirectiveParsingError(f"Error in @spaceless directive: {str(e)}")
 
@@ -1234,13 +1878,12 @@ class DirectiveParser:
 
                 # Evaluate expressions
                 try:
-                    value = eval(expression, {}, self._context)
+                    value = eval(compile_expression(expression), TEMPLATE_GLOBALS, self._context)
                 except Exception as e:
                     raise DirectiveParsingError(f"Error evaluating with expressions '{expression}': {str(e)}")
 
-                local_context = self._context.copy()
-                local_context[variable] = value
-                return self._variable_parser.parse_variables(content, local_context)
+                # The variable is looked up first, before the rest of the context, which is never copied
+                return self._variable_parser.parse_variables(content, ChainMap({variable: value}, self._context))
 
             except Exception as e:
                 raise DirectiveParsingError(f"Error in @with directive: {str(e)}")
@@ -1264,21 +1907,19 @@ class DirectiveParser:
 
     def _parse_conditional_attributes(self, template):
 
-        def handle_conditional_attributes(match):
-            directive = match.group("directive")
-            expression = match.group("expression")
-            if not expression:
-                expression = True
+        outputs = self._CONDITIONAL_ATTRIBUTE_OUTPUTS
+        context = self._context
 
-            if expression is True or (eval(expression, {}, self._context)):
-                return directive if directive != "autocomplete" else "on"
-            return "" if directive != "autocomplete" else "off"
+        def handle_conditional_attributes(match):
+            directive, expression = match.group("directive", "expression")
+            # A directive without a condition always holds
+            holds = not expression or bool(eval(compile_expression(expression), TEMPLATE_GLOBALS, context))
+            return outputs[directive][holds]
 
         return self._CONDITIONAL_ATTRIBUTES_PATTERN.sub(handle_conditional_attributes, template)
 
     def _parse_static(self, template):
-        pattern = re.compile(r"@static\s*\(\s*(?P<path>.*?)\s*\)", re.DOTALL)
-        return pattern.sub(lambda match: self._handle_static(match), template)
+        return self._STATIC_PATTERN.sub(lambda match: self._handle_static(match), template)
 
     @staticmethod
     def _handle_static(match):
@@ -1329,8 +1970,7 @@ class DirectiveParser:
             error = errors.get(field_name)
 
             if error:
-                local_context = self._context.copy()
-                local_context["message"] = ErrorMessageContext(error)
+                local_context = ChainMap({"message": ErrorMessageContext(error)}, self._context)
                 slot = self._variable_parser.parse_variables(slot, local_context)
                 return slot
 
@@ -1340,8 +1980,7 @@ class DirectiveParser:
 
     def _parse_active(self, template):
         """Use the @active('route_name', 'active_class') directive to set an active class in a nav link"""
-        pattern = re.compile(r"@active\((?P<route>.*?)(?:,(?P<param>.*?))?\)", re.DOTALL)
-        return pattern.sub(lambda match: self._handle_active(match), template)
+        return self._ACTIVE_PATTERN.sub(lambda match: self._handle_active(match), template)
 
     def _handle_active(self, match):
         try:
@@ -1383,17 +2022,14 @@ class DirectiveParser:
                 field_path = match.group("field").strip()
                 attrs_str = match.group("attributes").strip()
 
-                # Parse variables in case the field path or attributes are variables
-                field_path = self._variable_parser.parse_variables(field_path, self._context)
-                attrs_str = self._variable_parser.parse_variables(attrs_str, self._context)
+                # Parse variables in case the field path or attributes are variables. Static ones are
+                # kept as they are, so their parsed attributes come straight from the cache.
+                if "{" in field_path:
+                    field_path = self._variable_parser.parse_variables(field_path, self._context)
+                if "{" in attrs_str:
+                    attrs_str = self._variable_parser.parse_variables(attrs_str, self._context)
 
-                parts = field_path.split(".")
-                if len(parts) < 2 or len(parts) > 2:
-                    raise DirectiveParsingError(
-                        f"Invalid form field : {field_path}. Must be in format 'form.field_name'"
-                    )
-                else:
-                    form_name, field_name = parts
+                form_name, field_name = self._split_field_path(field_path)
 
                 form = self._context.get(form_name)
                 if not form:
@@ -1404,20 +2040,9 @@ class DirectiveParser:
                 if not field:
                     raise DirectiveParsingError(f"Field '{field_name}' not found in the form")
 
-                # Parse HTML-like attributes
-                attributes = {}
-
-                if attrs_str:
-                    attrs = attrs_str.strip().split(" ")
-                    for attr in attrs:
-                        if len(attr.split("=")) > 1:
-                            attributes[attr.split("=")[0]] = attr.split("=")[1].strip("\"'")
-                        else:
-                            attributes[attr.split("=")[0]] = attr.split("=")[0]
-
                 # Update the field widget attributes
                 widget = field.widget
-                widget.attrs.update(attributes)
+                widget.attrs.update(self._split_field_attributes(attrs_str))
 
                 return form[field_name].as_widget()
 
@@ -1426,6 +2051,62 @@ class DirectiveParser:
 
         return self._FIELD_PATTERN.sub(replace_field, template)
 
+    @staticmethod
+    @lru_cache(maxsize=256)
+    def _split_field_path(field_path: str) -> Tuple[str, str]:
+        """Split the path of a form field into the form and field names, once for each path."""
+        parts = field_path.split(".")
+        if len(parts) != 2:
+            raise DirectiveParsingError(f"Invalid form field : {field_path}. Must be in format 'form.field_name'")
+        return parts[0], parts[1]
+
+    @staticmethod
+    @lru_cache(maxsize=256)
+    def _split_field_attributes(attrs_str: str) -> Tuple[Tuple[str, str], ...]:
+        """
+        Split the HTML-like attributes of a @field directive in a single pass, once for each attribute string.
+
+        Quoted values are read up to their closing quote, so they may contain spaces. Boolean attributes,
+        without a value, take their own name as value.
+
+        Returns:
+            The attribute names and values, in their order of appearance
+        """
+        attributes = []
+        length = len(attrs_str)
+        position = DirectiveParser._WHITESPACE_PATTERN.match(attrs_str).end()
+        while position < length:
+            end = position
+            while end < length and attrs_str[end] != "=" and not attrs_str[end].isspace():
+                end += 1
+            name = attrs_str[position:end]
+
+            position = DirectiveParser._WHITESPACE_PATTERN.match(attrs_str, end).end()
+            if position < length and attrs_str[position] == "=":
+                position = DirectiveParser._WHITESPACE_PATTERN.match(attrs_str, position + 1).end()
+                quote = attrs_str[position] if position < length else ""
+                if quote in ("'", '"'):
+                    position += 1
+                    end = attrs_str.find(quote, position)
+                    if end == -1:
+                        end = length
+                    value = attrs_str[position:end]
+                    end += 1
+                else:
+                    end = position
+                    while end < length and not attrs_str[end].isspace():
+                        end += 1
+                    value = attrs_str[position:end]
+                position = DirectiveParser._WHITESPACE_PATTERN.match(attrs_str, end).end()
+            else:
+                value = name
+
+            # A stray "=" has no name, its value is dropped
+            if name:
+                attributes.append((name, value))
+
+        return tuple(attributes)
+
     def _parse_liveblade(self, template):
         """
         Parse @liveblade directive to render a live blade component.
@@ -1459,7 +2140,7 @@ class DirectiveParser:
             depth = 0
 
             # Simple state machine to track tag depth
-            for match in re.finditer(r"<(/)?(\w+)[^>]*>", html_content):
+            for match in self._HTML_TAG_PATTERN.finditer(html_content):
                 is_closing = match.group(1) == "/"
                 tag = match.group(2)
 
@@ -1481,9 +2162,9 @@ class DirectiveParser:
             liveblade = loader.load_template(f"liveblade.{component_name}")
 
             # Ensure the component has only one root node after removing all comments
-            html_content = re.sub(r"<!--.*?-->", "", liveblade.content, flags=re.DOTALL)
-            html_content = re.sub(self._COMMENT_PATTERN, "", html_content)
-            html_content = re.sub(self._COMMENTS_PATTERN, "", html_content)
+            html_content = self._HTML_COMMENT_PATTERN.sub("", liveblade.content)
+            html_content = self._COMMENT_PATTERN.sub("", html_content)
+            html_content = self._strip_inline_comments(html_content)
 
             if not validate_single_root_node(html_content):
                 raise TemplateRenderingError("LiveBlade component must have a single root node.")
@@ -1491,7 +2172,7 @@ class DirectiveParser:
             # Render the template content
             try:
                 module = importlib.import_module(f"liveblade.{component_name}")
-                cls = getattr(module, f"{re.sub('[-_]', '', component_name.title())}Component")
+                cls = getattr(module, f"{self._NAME_SEPARATOR_PATTERN.sub('', component_name.title())}Component")
                 component = cls(f"liveblade.{component_name}")
                 parsed = component.render()
                 return parsed
@@ -1528,7 +2209,7 @@ class DirectiveParser:
             singular = None
 
             # Parse the block for @plural
-            plural_match = re.search(r"(?P<singular>.*)@plural\s*(?P<plural>.*)", block_content, re.DOTALL)
+            plural_match = self._PLURAL_PATTERN.search(block_content)
             if plural_match:
                 singular = plural_match.group("singular").strip()
                 plural = plural_match.group("plural").strip()
@@ -1543,37 +2224,15 @@ class DirectiveParser:
                 return ngettext(singular, plural, count)
             return _(singular)
 
-        # Regex patterns
-        translate_pattern = re.compile(
-            r"@(?:trans|translate)\(\s*(?P<text>'[^']+'|\"[^\"]+\")\s*"
-            r"(?:,\s*context\s*=\s*(?P<context>'[^']+'|\"[^\"]+\"))?\s*\)",
-            re.DOTALL,
-        )
-        blocktranslate_pattern = re.compile(
-            r"@blocktranslate(?:\s+count\s+(?P<count>\w+))?\s*\{(?P<block>.*?)@endblocktranslate\}", re.DOTALL
-        )
-
         # Replace directives in content
-        template = translate_pattern.sub(replace_trans, template)
-        template = blocktranslate_pattern.sub(replace_blocktrans, template)
+        template = self._TRANSLATE_PATTERN.sub(replace_trans, template)
+        template = self._BLOCKTRANSLATE_PATTERN.sub(replace_blocktrans, template)
 
         return template
 
     def _parse_comment(self, template):
         return self._COMMENT_PATTERN.sub("", template)
 
-    def _parse_verbatim_shorthand(self, template: str) -> str:
-        """Process shorthand verbatim syntax (@{{ variable }})."""
-
-        def replace_verbatim_shorthand(match: Match) -> str:
-            try:
-                # Remove the @ and return the content as is
-                return match.group(1)
-            except Exception as e:
-                raise DirectiveParsingError(f"Error in verbatim shorthand: {str(e)}")
-
-        return self._VERBATIM_SHORTHAND_PATTERN.sub(replace_verbatim_shorthand, template)
-
     def _parse_liveblade_scripts(self, template: str) -> str:
         """Process @liveblade_scripts directive to include Liveblade scripts."""
 
@@ -1686,12 +2345,7 @@ class DirectiveParser:
         if keyword.iskeyword(name):
             raise ValueError(f"'{name}' is a Python keyword and cannot be used as a variable name")
 
-        # Regular expression for valid Python variable names:
-        # - Must start with letter or underscore
-        # - Can only contain letters, numbers and underscores
-        pattern = r"^[a-zA-Z_][a-zA-Z0-9_]*$"
-
-        if not re.match(pattern, name):
+        if not self._VARIABLE_NAME_PATTERN.match(name):
             raise ValueError(
                 f"'{name}' is not a valid variable name. Variable names must:\n"
                 "- Start with a letter or underscore\n"
@@ -1705,3 +2359,51 @@ class DirectiveParser:
         if (text[0], text[-1]) not in (('"', '"'), ("'", "'")):
             raise ValueError(f"{text} is not a valid string. Argument must be of type string.")
         return text[1:-1]
+
+    # Inline directive passes, in the order they run. A pass is skipped when its marker does not appear in the
+    # template, or run every time when it has none.
+    _INLINE_PASSES: Tuple[Tuple[Optional[str], Callable[["DirectiveParser", str], str]], ...] = (
+        ("@active", _parse_active),
+        # Form helpers
+        ("@csrf", _parse_csrf),
+        ("@method", _parse_method),
+        ("@", _parse_conditional_attributes),
+        ("@field", _parse_field),
+        ("@error", _parse_error),
+        # Components related
+        # Parse slots first to ensure they're captured before any component rendering
+        (None, _parse_slot_tags),
+        ("<b-", _parse_pyblade_tags),
+        ("@component", _parse_component),
+        ("@include", _parse_include),
+        ("@extends", _parse_extends),
+        # Django-like directives
+        ("@static", _parse_static),
+        ("@now", _parse_now),
+        ("@cycle", _parse_cycle),
+        ("@debug", _parse_debug),
+        ("@filter", _parse_filter),
+        ("@firstof", _parse_firstof),
+        ("@ifchanged", _parse_ifchanged),
+        ("@lorem", _parse_lorem),
+        ("@querystring", _parse_querystring),
+        ("@regroup", _parse_regroup),
+        ("@spaceless", _parse_spaceless),
+        ("@templatetag", _parse_templatetag),
+        ("@widthratio", _parse_widthratio),
+        ("@with", _parse_with),
+        ("@component", _parse_component),
+        ("@url", _parse_url),
+        ("@autoescape", _parse_autoescape),
+        # Process liveblade
+        ("@liveblade", _parse_liveblade_scripts),
+        ("@liveblade", _parse_liveblade),
+        # Process Bootstrap directives
+        ("@bootstrap_css", lambda self, template: self._process_bootstrap_css(template, self._context)),
+        ("@bootstrap_javascript", lambda self, template: self._process_bootstrap_javascript(template, self._context)),
+        # Process Tailwind directives
+        ("@tailwind_preload_css", lambda self, template: self._process_tailwind_preload_css(template, self._context)),
+        ("@tailwind_css", lambda self, template: self._process_tailwind_css(template, self._context)),
+        # Restore verbatim content
+        ("@__verbatim__", _restore_verbatim),
+    )
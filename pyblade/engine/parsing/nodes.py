@@ -0,0 +1,646 @@
+"""
+Compiled template nodes produced by the directive parser.
+"""
+
+import ast
+import copy
+import re
+import sys
+import threading
+from itertools import chain, count, repeat
+from operator import attrgetter, methodcaller
+from types import CodeType
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+from uuid import uuid4
+
+from ..contexts import LoopContext
+from ..exceptions import DirectiveParsingError
+from ..sandbox import TEMPLATE_GLOBALS, compile_expression
+from .variables import Interpolation, VariableParser
+
+# Expressions that are a bare name, resolved with a context lookup instead of eval
+_IDENTIFIER_PATTERN = re.compile(r"\s*(?P<name>[A-Za-z_]\w*)\s*")
+
+# Types of the literal values that are never modified, and can be shared between renders
+_IMMUTABLE_TYPES = (str, bytes, int, float, complex, bool, type(None))
+
+# Types of the switch values looked up in a jump table. Their hash agrees with their equality with any case value,
+# unlike objects with a custom __eq__ that may equal a constant case without hashing like it.
+_JUMP_TABLE_TYPES = frozenset((str, int, float, bool, type(None)))
+
+# Marks a name missing from the context
+_MISSING = object()
+
+# Reads the authentication state of the request's user in a single call
+_is_authenticated = attrgetter("user.is_authenticated")
+
+# Static texts up to this length are interned, longer ones are shared through the text pool
+_INTERN_MAX_LENGTH = 64
+
+# Static texts shared between compiled templates. Sharing is only an optimization, so the pool is simply
+# emptied when it grows past its limit.
+_TEXT_POOL: Dict[str, str] = {}
+_TEXT_POOL_MAX_SIZE = 10000
+
+# Verbatim placeholder ids: a random prefix drawn once, so they can't be guessed, and a counter to make them unique
+_VERBATIM_ID_PREFIX = uuid4().hex
+_verbatim_ids = count()
+
+# Output buffers released by finished renders, kept per thread for the next ones
+_buffers = threading.local()
+
+
+def share_text(text: str) -> str:
+    """Return a shared copy of a static text, so identical texts of compiled templates are stored once."""
+    if len(text) <= _INTERN_MAX_LENGTH:
+        return sys.intern(text)
+    if len(_TEXT_POOL) >= _TEXT_POOL_MAX_SIZE:
+        _TEXT_POOL.clear()
+    return _TEXT_POOL.setdefault(text, text)
+
+
+def _field_getter(expression: str, variable: str) -> Optional[Callable[[Any], Any]]:
+    """
+    Build a function reading a field of the loop variable, for expressions like 'item.name' or "item.get('name')".
+
+    Returns:
+        The getter, or None if the expression reads anything else
+    """
+    try:
+        tree = ast.parse(expression, mode="eval").body
+    except SyntaxError:
+        return None
+
+    if isinstance(tree, ast.Call):
+        method = tree.func
+        if (
+            isinstance(method, ast.Attribute)
+            and isinstance(method.value, ast.Name)
+            and method.value.id == variable
+            and not tree.keywords
+            and all(isinstance(argument, ast.Constant) for argument in tree.args)
+        ):
+            return methodcaller(method.attr, *(argument.value for argument in tree.args))
+        return None
+
+    names = []
+    while isinstance(tree, ast.Attribute):
+        names.append(tree.attr)
+        tree = tree.value
+    if names and isinstance(tree, ast.Name) and tree.id == variable:
+        return attrgetter(".".join(reversed(names)))
+    return None
+
+
+def _is_immutable(value: Any) -> bool:
+    """Check whether a literal value, tuples included, can never be modified."""
+    if isinstance(value, tuple):
+        return all(_is_immutable(item) for item in value)
+    return isinstance(value, _IMMUTABLE_TYPES)
+
+
+def acquire_buffer() -> List[str]:
+    """Take an empty output buffer from the current thread's pool, or a new one if it is empty."""
+    pool = getattr(_buffers, "pool", None)
+    if pool is None:
+        pool = _buffers.pool = []
+    return pool.pop() if pool else []
+
+
+def release_buffer(buffer: List[str]) -> None:
+    """Empty an output buffer and give it back to the current thread's pool."""
+    del buffer[:]
+    _buffers.pool.append(buffer)
+
+
+class _BreakLoop(Exception):
+    """Raised by a triggered @break to stop the enclosing loop."""
+
+
+class _ContinueLoop(Exception):
+    """Raised by a triggered @continue to skip the current iteration."""
+
+
+Writer = Callable[[str], Any]
+
+
+class Node:
+    """Base class for all compiled template nodes."""
+
+    def render(self, context: Dict[str, Any], write: Writer) -> None:
+        """Render the node, passing every chunk of output to ``write``."""
+        raise NotImplementedError
+
+
+def render_nodes(nodes: List[Node], context: Dict[str, Any], write: Writer) -> None:
+    """Render a list of nodes into the same writer."""
+    for node in nodes:
+        node.render(context, write)
+
+
+class Expression:
+    """
+    A directive expression, compiled once to a code object.
+    Bare names are looked up in the context directly, anything else is evaluated.
+    """
+
+    def __init__(self, source: str):
+        self.source = source
+        match = _IDENTIFIER_PATTERN.fullmatch(source)
+        self.name = match.group("name") if match else None
+
+        # A syntax error is reported when the expression is evaluated, like any other evaluation error
+        self.code: Union[CodeType, str] = compile_expression(source)
+
+    def evaluate(self, context: Dict[str, Any]) -> Any:
+        if self.name is not None:
+            value = context.get(self.name, _MISSING)
+            if value is not _MISSING:
+                return value
+
+        # Builtins, keywords and undefined names go through eval to keep their usual semantics
+        return eval(self.code, TEMPLATE_GLOBALS, context)
+
+    def __str__(self) -> str:
+        return self.source
+
+
+class CompiledTemplate:
+    """A template compiled once into a tree of nodes, ready to be rendered with any context."""
+
+    def __init__(self, nodes: List[Node], run: Optional[Callable[[Dict[str, Any], Writer], None]] = None):
+        self.nodes = nodes
+        # Renders the nodes from generated code, when the parser provides it
+        self.run = run
+
+    def render(self, context: Dict[str, Any]) -> str:
+        parts = acquire_buffer()
+        try:
+            if self.run is not None:
+                self.run(context, parts.append)
+            else:
+                render_nodes(self.nodes, context, parts.append)
+            return "".join(parts)
+        finally:
+            release_buffer(parts)
+
+
+class TextNode(Node):
+    """Static text between directives."""
+
+    def __init__(self, text: str):
+        self.text = text
+
+    def render(self, context: Dict[str, Any], write: Writer) -> None:
+        write(self.text)
+
+
+class LoopTextNode(TextNode):
+    """Static text inside a @for body, whose variables are resolved on every iteration."""
+
+    def __init__(self, text: str, line: int = 1):
+        super().__init__(text)
+        self.line = line
+        self.segments = [
+            share_text(segment) if isinstance(segment, str) else segment
+            for segment in VariableParser.compile_segments(text, line)
+        ]
+
+    def render(self, context: Dict[str, Any], write: Writer) -> None:
+        for segment in self.segments:
+            write(segment if isinstance(segment, str) else segment.render(context))
+
+
+class VerbatimNode(Node):
+    """Content of a @verbatim block or a @{{ }} shorthand, kept away from any further processing."""
+
+    def __init__(self, content: str):
+        self.content = content
+
+    def render(self, context: Dict[str, Any], write: Writer) -> None:
+        verbatim_id = f"{_VERBATIM_ID_PREFIX}{next(_verbatim_ids):x}"
+        context.setdefault("__verbatims", {})[verbatim_id] = self.content
+        write(f"@__verbatim__({verbatim_id})")
+
+
+class IfNode(Node):
+    """An @if block with its @elif branches and optional @else."""
+
+    def __init__(self):
+        self.branches: List[Tuple[Expression, List[Node]]] = []
+        self.else_nodes: Optional[List[Node]] = None
+
+    def add_branch(self, expression: str) -> List[Node]:
+        """Add an @if or @elif branch and return its body."""
+        self.branches.append((Expression(expression), []))
+        return self.branches[-1][1]
+
+    def render(self, context: Dict[str, Any], write: Writer) -> None:
+        for expression, nodes in self.branches:
+            try:
+                condition = expression.evaluate(context)
+            except Exception as e:
+                raise self.condition_error(e)
+
+            if condition:
+                render_nodes(nodes, context, write)
+                return
+
+        if self.else_nodes is not None:
+            render_nodes(self.else_nodes, context, write)
+
+    @staticmethod
+    def condition_error(error: Exception) -> DirectiveParsingError:
+        """Build the error raised when the condition of a branch cannot be evaluated."""
+        return DirectiveParsingError(f"Error in @if directive: {str(error)}")
+
+
+class UnlessNode(Node):
+    """An @unless block."""
+
+    def __init__(self, expression: str):
+        self.expression = Expression(expression)
+        self.nodes: List[Node] = []
+
+    def render(self, context: Dict[str, Any], write: Writer) -> None:
+        try:
+            condition = self.expression.evaluate(context)
+        except Exception as e:
+            raise self.condition_error(e)
+
+        if not condition:
+            render_nodes(self.nodes, context, write)
+
+    def condition_error(self, error: Exception) -> DirectiveParsingError:
+        """Build the error raised when the condition cannot be evaluated."""
+        return DirectiveParsingError(
+            f"Error in @unless directive: Error evaluating unless condition '{self.expression}': {str(error)}"
+        )
+
+
+class ForNode(Node):
+    """A @for loop with its optional @empty fallback."""
+
+    def __init__(
+        self,
+        variable: str,
+        iterable: str,
+        bind: Optional[Callable[[Dict[str, Any], Any], None]] = None,
+        target: Optional[str] = None,
+    ):
+        self.variable = variable
+        self.iterable = Expression(iterable)
+        # Assigns each item to the loop variables, when the item is unpacked into several of them
+        self.bind = bind
+        # The loop variables as an assignment target in generated code, like "context['item']"
+        self.target = target or f"context[{variable!r}]"
+        # Runs every iteration of the loop, generated by the parser
+        self.run: Optional[Callable[[Dict[str, Any], Any, LoopContext, Writer], None]] = None
+        self.nodes: List[Node] = []
+        self.empty_nodes: Optional[List[Node]] = None
+        # Segments of a body that prints nothing but the loop variable or its fields, see specialize()
+        self.item_segments: Optional[List[Union[str, Interpolation]]] = None
+        # The getter of the field each of these segments prints, None for static texts and the variable itself
+        self.item_getters: List[Optional[Callable[[Any], Any]]] = []
+        # Whether a @break or @continue can interrupt an iteration, set by the parser
+        self.interruptible = False
+
+    def specialize(self) -> None:
+        """
+        Detect a body made of static text, the bare loop variable and its fields only, like '<li>{{ item }}</li>'
+        or "<li>{{ city.get('name') }}</li>".
+
+        Such a body does not depend on anything else in the context, so its iterations are rendered
+        straight from the items, without updating the context or the loop variable on each of them.
+        """
+        if self.bind is not None or len(self.nodes) != 1 or not isinstance(self.nodes[0], LoopTextNode):
+            return
+
+        segments = self.nodes[0].segments
+        getters = []
+        for segment in segments:
+            if isinstance(segment, str) or segment.expression == self.variable:
+                getters.append(None)
+                continue
+            # Expressions the sandbox rejects keep reporting their error from the regular rendering
+            getter = _field_getter(segment.expression, self.variable) if isinstance(segment.code, CodeType) else None
+            if getter is None:
+                return
+            getters.append(getter)
+
+        self.item_segments = segments
+        self.item_getters = getters
+
+    def render(self, context: Dict[str, Any], write: Writer) -> None:
+        try:
+            iterable = self.iterable.evaluate(context)
+        except Exception as e:
+            raise DirectiveParsingError(
+                f"Error in @for directive: Error evaluating iterable expression '{self.iterable}': {str(e)}"
+            )
+
+        if not iterable:
+            if self.empty_nodes:
+                render_nodes(self.empty_nodes, context, write)
+            return
+
+        if self.item_segments is not None and isinstance(iterable, (list, tuple, range)):
+            try:
+                self._render_items(iterable, context, write)
+                return
+            except Exception:
+                # Rendered again below, to raise the error of the expression that failed like any other loop
+                pass
+
+        current_loop = context.get("loop")
+        loop = LoopContext(iterable, parent=current_loop)
+
+        try:
+            if self.run is not None:
+                self.run(context, iterable, loop, write)
+            else:
+                self._render_interruptible(iterable, context, loop, write)
+        except (_BreakLoop, _ContinueLoop):
+            # Signals meant for an enclosing loop are passed on as they are
+            raise
+        except Exception as e:
+            raise DirectiveParsingError(f"Error in @for directive: {str(e)}")
+
+        if current_loop is None:
+            context.pop("loop")
+        else:
+            context["loop"] = current_loop
+
+    def unpack_error(self, error: Exception) -> DirectiveParsingError:
+        """Build the error raised when an item cannot be unpacked into the loop variables."""
+        return DirectiveParsingError(f"Cannot unpack into '{self.variable}': {error}")
+
+    def _render_interruptible(self, iterable: Any, context: Dict[str, Any], loop: LoopContext, write: Writer) -> None:
+        """Render the iterations of a loop containing @break or @continue."""
+        # An iteration interrupted by @break or @continue outputs nothing, so each one is buffered
+        iteration = acquire_buffer()
+
+        for index, item in enumerate(iterable):
+            loop.index = index
+            context["loop"] = loop
+            if self.bind is None:
+                context[self.variable] = item
+            else:
+                try:
+                    self.bind(context, item)
+                except (TypeError, ValueError) as e:
+                    raise self.unpack_error(e)
+
+            del iteration[:]
+            try:
+                render_nodes(self.nodes, context, iteration.append)
+            except _BreakLoop:
+                break
+            except _ContinueLoop:
+                continue
+
+            if iteration:
+                write("".join(iteration))
+
+        release_buffer(iteration)
+
+    def _render_items(self, items: Union[list, tuple, range], context: Dict[str, Any], write: Writer) -> None:
+        """
+        Render a specialized body for each item.
+
+        Each segment is turned into a column holding its output for every item, read from the items with
+        map, and the columns are then joined row by row into a single write.
+        """
+        columns = []
+        for segment, getter in zip(self.item_segments, self.item_getters):
+            if isinstance(segment, str):
+                columns.append(repeat(segment, len(items)))
+            elif getter is None:
+                columns.append(map(segment.format, items))
+            else:
+                columns.append(map(segment.format, map(getter, items)))
+
+        write("".join(chain.from_iterable(zip(*columns))))
+
+        # Leave the loop variable as a regular loop would
+        context[self.variable] = items[-1]
+
+
+class BreakNode(Node):
+    """A @break directive, optionally conditioned by an expression."""
+
+    directive = "break"
+    signal = _BreakLoop
+
+    def __init__(self, expression: Optional[str] = None):
+        self.expression = Expression(expression) if expression else None
+
+    def render(self, context: Dict[str, Any], write: Writer) -> None:
+        if self.expression:
+            try:
+                triggered = self.expression.evaluate(context)
+            except Exception as e:
+                raise DirectiveParsingError(f"Error in @{self.directive} directive: {str(e)}")
+            if not triggered:
+                return
+
+        raise self.signal()
+
+
+class ContinueNode(BreakNode):
+    """A @continue directive, optionally conditioned by an expression."""
+
+    directive = "continue"
+    signal = _ContinueLoop
+
+
+class SwitchNode(Node):
+    """A @switch (or @match) block with its @case branches and optional @default."""
+
+    def __init__(self, expression: str):
+        self.expression = Expression(expression)
+        self.cases: List[Tuple[Expression, List[Node]]] = []
+        self.default_nodes: Optional[List[Node]] = None
+        # Maps the values of the leading constant cases to the index of their branch, and the number of such cases
+        self.jump_table: Optional[Dict[Any, int]] = None
+        self.jump_end = 0
+
+    def add_case(self, expression: str) -> List[Node]:
+        """Add a @case branch and return its body."""
+        self.cases.append((Expression(expression), []))
+        return self.cases[-1][1]
+
+    def render(self, context: Dict[str, Any], write: Writer) -> None:
+        index = self.select(context)
+        if index == len(self.cases):
+            nodes = self.default_nodes
+        elif index >= 0:
+            nodes = self.cases[index][1]
+        else:
+            return
+
+        if nodes is not None:
+            render_nodes(nodes, context, write)
+
+    def select(self, context: Dict[str, Any]) -> int:
+        """
+        Find the branch to render.
+
+        Returns:
+            The index of the matching case, the number of cases for the default branch, or -1 if there is none
+        """
+        try:
+            switch_value = self.expression.evaluate(context)
+        except Exception as e:
+            raise DirectiveParsingError(
+                f"Error in @switch directive: Error evaluating switch expression '{self.expression}': {str(e)}"
+            )
+
+        start = 0
+        if self.jump_table is not None and type(switch_value) in _JUMP_TABLE_TYPES:
+            index = self.jump_table.get(switch_value)
+            if index is not None:
+                return index
+            start = self.jump_end
+
+        for index in range(start, len(self.cases)):
+            case_value = self.cases[index][0]
+            try:
+                case_result = case_value.evaluate(context)
+            except Exception as e:
+                raise DirectiveParsingError(
+                    f"Error in @switch directive: Error evaluating case value '{case_value}': {str(e)}"
+                )
+
+            if case_result == switch_value:
+                return index
+
+        return len(self.cases) if self.default_nodes is not None else -1
+
+
+class PropsNode(Node):
+    """A @props directive, giving default values to the variables a template expects."""
+
+    def __init__(self, defaults: Optional[Dict[str, Any]] = None, code: Optional[CodeType] = None):
+        self.defaults = defaults
+        self.code = code
+        # Defaults like lists or dictionaries are copied for each render, so that renders never share them
+        self.shared = defaults is not None and all(_is_immutable(value) for value in defaults.values())
+
+    def resolve(self, context: Dict[str, Any]) -> Dict[str, Any]:
+        """Get the default values, evaluating them only when they are not literals."""
+        if self.defaults is not None:
+            return self.defaults if self.shared else copy.deepcopy(self.defaults)
+
+        try:
+            defaults = eval(self.code, TEMPLATE_GLOBALS, context)
+        except Exception as e:
+            raise DirectiveParsingError(f"Error in @props directive: {str(e)}")
+
+        if not isinstance(defaults, dict):
+            raise DirectiveParsingError("Error in @props directive: expected a dictionary")
+        return defaults
+
+    def render(self, context: Dict[str, Any], write: Writer) -> None:
+        for key, value in self.resolve(context).items():
+            context.setdefault(key, value)
+
+
+class AttributeDictNode(Node):
+    """
+    Base class for the @class and @style directives, which render an HTML attribute
+    from the keys of a dictionary whose condition holds.
+    """
+
+    directive = ""
+
+    def __init__(self, source: str, entries: Optional[List[Tuple[str, CodeType]]] = None):
+        self.expression = Expression(source)
+        # Cleaned keys and their compiled condition, when the dictionary is a literal
+        self.entries = entries
+
+    @staticmethod
+    def clean_key(key: str) -> str:
+        """Normalize a key of the dictionary."""
+        raise NotImplementedError
+
+    def format(self, keys: List[str]) -> str:
+        """Build the attribute from the keys whose condition holds."""
+        raise NotImplementedError
+
+    def render(self, context: Dict[str, Any], write: Writer) -> None:
+        try:
+            if self.entries is not None:
+                keys = [
+                    key
+                    for key, condition in self.entries
+                    if self._holds(eval(condition, TEMPLATE_GLOBALS, context), context)
+                ]
+            else:
+                attributes = self.expression.evaluate(context)
+                if not isinstance(attributes, dict):
+                    raise DirectiveParsingError(f"@{self.directive} directive requires a dictionary")
+
+                keys = [
+                    self.clean_key(key)
+                    for key, condition in attributes.items()
+                    if self._holds(condition, context) and self.clean_key(key)
+                ]
+        except Exception as e:
+            raise DirectiveParsingError(f"Error in @{self.directive} directive: {str(e)}")
+
+        if keys:
+            write(self.format(keys))
+
+    @staticmethod
+    def _holds(condition: Any, context: Dict[str, Any]) -> bool:
+        # Conditions that are not booleans yet are evaluated as expressions
+        if not isinstance(condition, bool):
+            condition = eval(compile_expression(str(condition)), TEMPLATE_GLOBALS, context)
+        return bool(condition)
+
+
+class ClassNode(AttributeDictNode):
+    """A @class directive, like @class({'active': is_active})."""
+
+    directive = "class"
+
+    @staticmethod
+    def clean_key(key: str) -> str:
+        return key.strip().strip("\"'")
+
+    def format(self, keys: List[str]) -> str:
+        return f' class="{" ".join(keys)}"'
+
+
+class StyleNode(AttributeDictNode):
+    """A @style directive, like @style({'color: red;': has_error})."""
+
+    directive = "style"
+
+    @staticmethod
+    def clean_key(key: str) -> str:
+        return key.strip().strip("\"'").rstrip(" ;")
+
+    def format(self, keys: List[str]) -> str:
+        return f' style="{"; ".join(keys)};"'
+
+
+class AuthNode(Node):
+    """An @auth, @guest or @anonymous block with its optional @else."""
+
+    def __init__(self, directive: str):
+        self.directive = directive
+        # @guest and @anonymous render their first block for users that are not authenticated
+        self.expects_authenticated = directive == "auth"
+        self.nodes: List[Node] = []
+        self.else_nodes: Optional[List[Node]] = None
+
+    def render(self, context: Dict[str, Any], write: Writer) -> None:
+        request = context.get("request")
+        is_authenticated = bool(request) and bool(_is_authenticated(request))
+
+        if is_authenticated is self.expects_authenticated:
+            render_nodes(self.nodes, context, write)
+        elif self.else_nodes is not None:
+            render_nodes(self.else_nodes, context, write)
@@ -3,19 +3,94 @@ Variable parsing and handling for the template engine.
 """
 
 import html
-import re
-from typing import Any, Dict, Match, Pattern
+from typing import Any, Dict, Iterator, List, Tuple, Union
 
 from ..contexts import AttributesContext, ClassContext, SlotContext
 from ..exceptions import UndefinedVariableError
+from ..sandbox import TEMPLATE_GLOBALS, compile_expression
+
+# The last text rendered from each template, with its compiled segments, see VariableParser._compile_text().
+# Shared by every parser, so that engines rendering the same templates compile their texts once.
+_COMPILED_TEXTS: Dict[str, Tuple[str, Tuple[Union[str, "Interpolation"], ...]]] = {}
+
+# Number of templates whose last compiled text is kept, the texts are simply all dropped past it
+_COMPILED_TEXTS_MAX_SIZE = 256
+
+
+def escape(text: str) -> str:
+    """
+    Escape a text like html.escape, which always runs its five replacements over the whole text.
+
+    Most texts have nothing to escape, and finding that out with one search per character is several times
+    faster on long texts, so those are returned as they are.
+    """
+    if "&" in text or "<" in text or ">" in text or '"' in text or "'" in text:
+        return html.escape(text)
+    return text
+
+
+class Interpolation:
+    """A {{ }} or {!! !!} expression, compiled once and rendered with any context."""
+
+    def __init__(self, expression: str, escape: bool, line: int):
+        self.expression = expression
+        self.escape = escape
+        self.line = line
+        self.name = expression.split(".")[0]
+        self.code = None
+
+        # Nested attributes and method calls are evaluated, plain names are looked up directly.
+        # A syntax error is reported when the expression is rendered, like any other evaluation error.
+        if "." in expression and not expression.startswith("."):
+            self.code = compile_expression(expression)
+
+    def render(self, context: Dict[str, Any]) -> str:
+        """
+        Render the expression with the given context.
+
+        Raises:
+            UndefinedVariableError: If the variable is not found in context
+        """
+        if not self.expression:
+            return ""
+
+        if self.expression.startswith("."):
+            raise UndefinedVariableError(f"Variable name should not start with '.' on line {self.line}")
+
+        if self.name not in context:
+            raise UndefinedVariableError(f"Undefined variable '{self.name}' on line {self.line}")
+
+        if self.code is None:
+            value = context[self.name]
+        else:
+            try:
+                value = eval(self.code, TEMPLATE_GLOBALS, context)
+            except Exception as e:
+                raise UndefinedVariableError(f"Error evaluating expression '{self.expression}': {str(e)}")
+
+        return self.format(value)
+
+    def format(self, value: Any) -> str:
+        """Convert the value of the expression to its output, escaping it if needed."""
+        # Plain strings need no conversion, and numbers have nothing to escape
+        value_type = type(value)
+        if value_type is str:
+            return escape(value) if self.escape else value
+        if value_type is int or value_type is float:
+            return str(value)
+
+        # Special context objects are never escaped
+        if self.escape and not isinstance(value, (SlotContext, AttributesContext, ClassContext)):
+            return escape(str(value))
+        return str(value)
 
 
 class VariableParser:
     """Handles parsing and rendering of template variables."""
 
-    # Cached regex patterns
-    _ESCAPED_VAR_PATTERN: Pattern = re.compile(r"{{\s*(.*?)\s*}}")
-    _UNESCAPED_VAR_PATTERN: Pattern = re.compile(r"{!!\s*(.*?)\s*!!}")
+    # Delimiters of the escaped and unescaped variables
+    _ESCAPED_DELIMITERS = ("{{", "}}")
+    _UNESCAPED_DELIMITERS = ("{!!", "!!}")
 
     def __init__(self):
         self._context: Dict[str, Any] = {}
@@ -33,82 +108,131 @@ class VariableParser:
             The template with all variables replaced
         """
         self._context = context
-        template = self._render_escaped_variables(template)
-        template = self._render_unescaped_variables(template)
-
-        return template
+        return self._render_variables(template)
 
-    def _render_escaped_variables(self, template: str) -> str:
+    @classmethod
+    def compile_segments(cls, text: str, line: int = 1) -> List[Union[str, Interpolation]]:
         """
-        Replace variables in {{ }} with escaped values.
+        Split a text into literal strings and compiled variables, so it can be rendered without any regex work.
 
         Args:
-            template: The template string
+            text: The text to split
+            line: The line on which the text starts in its template
 
         Returns:
-            The template with escaped variables replaced
+            The literal and variable segments of the text, in order
         """
-        return self._ESCAPED_VAR_PATTERN.sub(lambda match: self._replace_variable(match, escape=True), template)
+        segments: List[Union[str, Interpolation]] = []
+        position = 0
 
-    def _render_unescaped_variables(self, template: str) -> str:
-        """
-        Replace variables in {!! !!} with unescaped values.
+        for start, end, expression, escape in cls._scan_variables(text):
+            # Line breaks are counted from the previous variable on, not from the start of the text each time
+            line += text.count("\n", position, start)
+            if start > position:
+                segments.append(text[position:start])
+            segments.append(Interpolation(expression, escape, line))
+            line += text.count("\n", start, end)
+            position = end
 
-        Args:
-            template: The template string
+        if position < len(text):
+            segments.append(text[position:])
 
-        Returns:
-            The template with unescaped variables replaced
-        """
-        return self._UNESCAPED_VAR_PATTERN.sub(lambda match: self._replace_variable(match, escape=False), template)
+        return segments
 
-    def _replace_variable(self, match: Match, escape: bool) -> str:
+    def _render_variables(self, template: str) -> str:
         """
-        Replace a variable with its value from the context.
+        Replace variables in {{ }} with escaped values, and those in {!! !!} with unescaped values.
+
+        Both kinds are replaced in a single pass, so the output of a variable is never parsed again.
 
         Args:
-            match: The regex match object
-            escape: Whether to HTML escape the value
+            template: The template string
 
         Returns:
-            The replaced variable value
-
-        Raises:
-            UndefinedVariableError: If the variable is not found in context
+            The template with variables replaced
         """
-        expression = match.group(1)
+        segments = self._compile_text(template)
+        if not segments:
+            return template
 
-        if not expression:
-            return ""
-
-        if expression.startswith("."):
-            raise UndefinedVariableError(
-                f"Variable name should not start with '.' on line {self._get_line_number(match)}"
-            )
-
-        expression = expression.split(".")
-        variable_name = expression[0]
+        context = self._context
+        return "".join([segment if isinstance(segment, str) else segment.render(context) for segment in segments])
 
-        if variable_name not in self._context:
-            raise UndefinedVariableError(f"Undefined variable '{variable_name}' on line {self._get_line_number(match)}")
+    def _compile_text(self, text: str) -> Tuple[Union[str, Interpolation], ...]:
+        """
+        Split a text rendered from the current template into literal strings and compiled variables.
 
-        # Handle nested attributes and method calls
-        if len(expression) > 1:
-            try:
-                variable_value = eval(".".join(expression), {}, self._context)
-            except Exception as e:
-                raise UndefinedVariableError(f"Error evaluating expression '{'.'.join(expression)}': {str(e)}")
-        else:
-            variable_value = self._context[variable_name]
+        The directives of a template mostly render the same text every time, so the segments of the last text
+        of each template are kept, and reused for as long as that text does not change.
 
-        # Special context objects are never escaped
-        if isinstance(variable_value, (SlotContext, AttributesContext, ClassContext)):
-            escape = False
+        Returns:
+            The literal and variable segments of the text in order, or nothing if it has no variables
+        """
+        compiled = _COMPILED_TEXTS.get(self.initial_template)
+        if compiled is not None and compiled[0] == text:
+            return compiled[1]
+
+        segments: List[Union[str, Interpolation]] = []
+        position = 0
+        # Line numbers are counted from the previous variable on, not from the start of the template each time
+        line = 1
+        line_position = 0
+
+        for start, end, expression, escape in self._scan_variables(text):
+            line += self.initial_template.count("\n", line_position, start)
+            line_position = max(line_position, start)
+            segments.append(text[position:start])
+            segments.append(Interpolation(expression, escape, line))
+            position = end
+
+        if segments:
+            segments.append(text[position:])
+
+        compiled = (text, tuple(segments))
+        if len(_COMPILED_TEXTS) >= _COMPILED_TEXTS_MAX_SIZE:
+            _COMPILED_TEXTS.clear()
+        _COMPILED_TEXTS[self.initial_template] = compiled
+        return compiled[1]
+
+    @classmethod
+    def _scan_variables(cls, text: str) -> Iterator[Tuple[int, int, str, bool]]:
+        """
+        Find the {{ }} and {!! !!} variables of a text, from left to right, with str.find only.
 
-        # Convert to string and escape if needed
-        result = str(variable_value)
-        return html.escape(str(result)) if escape else str(result)
+        A variable ends at the first closing delimiter after its opening one, and its stripped expression
+        cannot span several lines. Once an opening delimiter has no closing one after it, no later one of
+        the same kind can have one either, so that kind is not searched anymore and the scan stays linear.
 
-    def _get_line_number(self, match: Match) -> int:
-        """Get the line number for a position in the template."""
-        return self.initial_template.count("\n", 0, match.start()) + 1
+        Yields:
+            The start and end of each variable, its stripped expression, and whether it is escaped
+        """
+        openings = {True: text.find("{{"), False: text.find("{!!")}
+        position = 0
+
+        while True:
+            for escape, opening in openings.items():
+                if -1 < opening < position:
+                    openings[escape] = text.find("{{" if escape else "{!!", position)
+
+            escaped_start, unescaped_start = openings[True], openings[False]
+            if escaped_start == -1 and unescaped_start == -1:
+                return
+
+            escape = unescaped_start == -1 or -1 < escaped_start < unescaped_start
+            start = escaped_start if escape else unescaped_start
+            opening, closing = cls._ESCAPED_DELIMITERS if escape else cls._UNESCAPED_DELIMITERS
+
+            body_start = start + len(opening)
+            close = text.find(closing, body_start)
+            if close == -1:
+                openings[escape] = -1
+                continue
+
+            expression = text[body_start:close].strip()
+            if "\n" in expression:
+                # Not a variable, the text is searched again from the next character
+                openings[escape] = text.find(opening, start + 1)
+                continue
+
+            position = close + len(closing)
+            yield start, position, expression, escape
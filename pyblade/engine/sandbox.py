@@ -1,8 +1,9 @@
 import ast
 import operator
 import math
-from typing import Any, Dict, Optional, Set, Union
-from functools import reduce
+from types import CodeType
+from typing import Any, Dict, Optional, Set, Tuple, Union
+from functools import lru_cache, reduce
 
 
 class SafeEvalException(Exception):
@@ -52,6 +53,25 @@ def _get_allowed_builtins() -> Dict[str, Any]:
     }
 
 
+# Globals shared by every template expression. They are built once so that evaluating an
+# expression never allocates a namespace, and only the allowed builtins are reachable.
+# The template context is always passed as locals, unchanged.
+TEMPLATE_GLOBALS: Dict[str, Any] = {'__builtins__': _get_allowed_builtins()}
+
+
+@lru_cache(maxsize=1024)
+def compile_expression(source: str) -> Union[CodeType, str]:
+    """
+    Compile a template expression for eval, once per process.
+
+    An invalid expression is returned unchanged, so that evaluating it raises the usual SyntaxError.
+    """
+    try:
+        return compile(source, "<template>", "eval")
+    except SyntaxError:
+        return source
+
+
 def _get_allowed_operators() -> Dict[type, Any]:
     """Get a dictionary of allowed operators."""
     return {
@@ -89,6 +109,92 @@ def _get_allowed_operators() -> Dict[type, Any]:
     }
 
 
+# Names an expression may use and still be folded to a constant
+_LITERAL_NAMES: Dict[str, Any] = {'pi': math.pi, 'e': math.e}
+
+# Operators a constant expression is folded with. Left shifts and matrix products are left to the
+# regular evaluation, as are repetitions of strings and sequences.
+_LITERAL_OPERATORS: Dict[type, Any] = {
+    op: function
+    for op, function in _get_allowed_operators().items()
+    if op not in (ast.LShift, ast.MatMult)
+}
+
+_NUMBER_TYPES = (int, float, complex, bool)
+
+
+class _NotLiteral(Exception):
+    """Raised when an expression cannot be folded to a constant."""
+    pass
+
+
+@lru_cache(maxsize=1024)
+def _fold_literal(expression: str, max_power: int, with_names: bool = True) -> Tuple[bool, Any]:
+    """
+    Evaluate an expression made of literals, math constants and operators only, once per expression.
+
+    Only immutable values are produced, so the cached result can be returned to every caller.
+    Without names, expressions using math constants are not folded either, for callers whose
+    expressions read every name from a context.
+
+    Returns:
+        Whether the expression could be folded, and its value
+    """
+    try:
+        tree = ast.parse(expression, mode="eval")
+        if not with_names and any(isinstance(node, ast.Name) for node in ast.walk(tree)):
+            return False, None
+        return True, _fold_node(tree.body, max_power)
+    except Exception:
+        # Anything else, including errors like a division by zero, goes through the regular evaluation
+        return False, None
+
+
+def _fold_node(node: ast.AST, max_power: int) -> Any:
+    """Recursively fold a node of a constant expression."""
+    if isinstance(node, ast.Constant):
+        return node.value
+
+    if isinstance(node, ast.Name) and node.id in _LITERAL_NAMES:
+        return _LITERAL_NAMES[node.id]
+
+    if isinstance(node, ast.Tuple):
+        return tuple(_fold_node(element, max_power) for element in node.elts)
+
+    if isinstance(node, ast.UnaryOp):
+        return _LITERAL_OPERATORS[type(node.op)](_fold_node(node.operand, max_power))
+
+    if isinstance(node, ast.BinOp):
+        left = _fold_node(node.left, max_power)
+        right = _fold_node(node.right, max_power)
+        if not (isinstance(left, _NUMBER_TYPES) and isinstance(right, _NUMBER_TYPES)):
+            # Only strings can be concatenated, their size is bounded by the expression itself
+            if not (isinstance(node.op, ast.Add) and isinstance(left, str) and isinstance(right, str)):
+                raise _NotLiteral()
+        elif isinstance(node.op, ast.Pow) and abs(right) > max_power:
+            raise _NotLiteral()
+        return _LITERAL_OPERATORS[type(node.op)](left, right)
+
+    if isinstance(node, ast.BoolOp):
+        # Like "and" and "or", return the operand deciding the result
+        for value in node.values:
+            value = _fold_node(value, max_power)
+            if bool(value) == isinstance(node.op, ast.Or):
+                return value
+        return value
+
+    if isinstance(node, ast.Compare):
+        left = _fold_node(node.left, max_power)
+        for op, comparator in zip(node.ops, node.comparators):
+            right = _fold_node(comparator, max_power)
+            if not _LITERAL_OPERATORS[type(op)](left, right):
+                return False
+            left = right
+        return True
+
+    raise _NotLiteral()
+
+
 def _get_safe_nodes() -> Set[type]:
     """Get a set of allowed AST node types."""
     return {
@@ -178,6 +284,12 @@ def safe_eval(
     if mode not in ("eval", "exec"):
         raise SafeEvalException("Mode must be 'eval' or 'exec'")
     
+    # Expressions of literals only are folded once, unless the constants they use are overridden
+    if mode == "eval" and not (allowed_locals and _LITERAL_NAMES.keys() & allowed_locals.keys()):
+        is_literal, value = _fold_literal(expression, max_power)
+        if is_literal:
+            return value
+    
     # Set up the execution environment
     safe_globals = {"__builtins__": None}
     if allowed_globals:
@@ -188,21 +300,7 @@ def safe_eval(
         safe_locals.update(allowed_locals)
     
     try:
-        # Parse the AST
-        try:
-            tree = ast.parse(expression, mode=mode)
-        except SyntaxError as e:
-            raise SafeEvalException(f"Syntax error: {str(e)}")
-        
-        # Validate the AST
-        if not _is_safe_ast(tree, max_power):
-            raise SafeEvalException("Unsafe expression detected")
-        
-        # Compile the AST
-        try:
-            compiled_code = compile(tree, "<string>", mode)
-        except Exception as e:
-            raise SafeEvalException(f"Compilation error: {str(e)}")
+        compiled_code = _compile_safe(expression, mode, max_power)
         
         # Execute with timeout if specified
         if timeout is not None:
@@ -229,6 +327,33 @@ def safe_eval(
         raise SafeEvalException(f"Evaluation error: {str(e)}")
 
 
+@lru_cache(maxsize=4096)
+def _compile_safe(expression: str, mode: str, max_power: int) -> CodeType:
+    """
+    Parse, validate and compile an expression, once for each expression, mode and power limit.
+
+    Only valid expressions are cached, invalid ones raise again on every call.
+
+    Raises:
+        SafeEvalException: If the expression is invalid or unsafe
+    """
+    # Parse the AST
+    try:
+        tree = ast.parse(expression, mode=mode)
+    except SyntaxError as e:
+        raise SafeEvalException(f"Syntax error: {str(e)}")
+
+    # Validate the AST
+    if not _is_safe_ast(tree, max_power):
+        raise SafeEvalException("Unsafe expression detected")
+
+    # Compile the AST
+    try:
+        return compile(tree, "<string>", mode)
+    except Exception as e:
+        raise SafeEvalException(f"Compilation error: {str(e)}")
+
+
 def safe_exec(
     expression: str,
     allowed_globals: Optional[Dict[str, Any]] = None,
@@ -255,8 +380,6 @@ def _is_safe_ast(node: ast.AST, max_power: int = 100) -> bool:
         bool: True if the AST is safe, False otherwise
     """
 
-    print(node)
-
     if not isinstance(node, tuple(_get_safe_nodes())):
         return False
     
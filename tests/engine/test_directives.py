@@ -1,5 +1,6 @@
 """Tests for template directives."""
 import pytest
+from pyblade.engine.exceptions import DirectiveParsingError
 from pyblade.engine.parsing.directives import DirectiveParser
 
 
@@ -108,6 +109,35 @@ def test_complex_if_elif_else():
     assert "1 is not less than 0" not in result
 
 
+def test_if_skips_branches_after_the_taken_one():
+    """Test that the conditions and bodies of the branches after the taken one are never evaluated."""
+    parser = DirectiveParser()
+    template = """
+    @if(first)
+        First
+    @elif(undefined_var)
+        {{ undefined_var }}
+    @else
+        @if(undefined_var)Nested@endif
+    @endif
+    """
+
+    result = parser.parse_directives(template, {"first": True})
+    assert "First" in result
+    assert "Nested" not in result
+
+
+def test_block_directive_names_in_text():
+    """Test that block directive names without their arguments or closing directive are left as text."""
+    parser = DirectiveParser()
+
+    result = parser.parse_directives("email@if.com @if(x)Y@endif", {"x": True})
+    assert result == "email@if.com Y"
+
+    result = parser.parse_directives("x@auth.io me@for.org a@switch.net @unless(x)N@endunless", {"x": True})
+    assert result == "x@auth.io me@for.org a@switch.net "
+
+
 def test_if_with_expressions():
     """Test if directives with complex expressions."""
     parser = DirectiveParser()
@@ -281,6 +311,69 @@ def test_nested_for_directive():
     assert result == "a1a2b1b2"
 
 
+def test_for_directive_unpacking():
+    """Test unpacking loop items into several variables."""
+    parser = DirectiveParser()
+    template = "@for(key, value in data.items()){{ key }}={{ value }};@endfor"
+    context = {"data": {"a": 1, "b": 2}}
+
+    result = parser.parse_directives(template, context)
+    assert result == "a=1;b=2;"
+
+    template = "@for((name, (x, y)) in points){{ name }}:{{ x }},{{ y }};@endfor"
+    result = parser.parse_directives(template, {"points": [("p", (1, 2))]})
+    assert result == "p:1,2;"
+
+    with pytest.raises(DirectiveParsingError):
+        parser.parse_directives("@for(key, value in items)@endfor", {"items": [1]})
+
+
+def test_for_directive_break_and_continue():
+    """Test that interrupted iterations output nothing, in nested loops too."""
+    parser = DirectiveParser()
+    template = (
+        "@for(x in items)@if(x == 3)@break@endif"
+        "@for(y in items)@continue(y == 1)[{{ x }}{{ y }}]@endfor;@endfor"
+    )
+    context = {"items": [0, 1, 2, 3, 4]}
+
+    result = parser.parse_directives(template, context)
+    assert result == "[00][02][03][04];[10][12][13][14];[20][22][23][24];"
+
+    # The buffers of the iterations are reused by the next renders
+    result = parser.parse_directives(template, {"items": [1, 2]})
+    assert result == "[12];[22];"
+
+
+def test_for_directive_body_errors():
+    """Test that errors raised while rendering the body of a loop are reported as @for errors."""
+    parser = DirectiveParser()
+
+    with pytest.raises(DirectiveParsingError) as exc_info:
+        parser.parse_directives("@for(x in items){{ x.nope }}@endfor", {"items": [1]})
+    assert str(exc_info.value).startswith("Error in @for directive: ")
+    assert "x.nope" in str(exc_info.value)
+
+    with pytest.raises(DirectiveParsingError) as exc_info:
+        parser.parse_directives("@for(a, b in items)@endfor", {"items": [1]})
+    assert str(exc_info.value).startswith("Error in @for directive: Cannot unpack into 'a, b'")
+
+
+def test_for_directive_over_records():
+    """Test loops printing fields of dictionaries and objects."""
+    parser = DirectiveParser()
+    template = "@for(city in cities)<li>{{ city.get('name') }}: {!! city.get('note') !!}</li>@endfor"
+    context = {"cities": [{"name": "<Goma>", "note": "<b>1</b>"}, {"name": "Kinshasa", "note": "2"}]}
+
+    result = parser.parse_directives(template, context)
+    assert result == "<li>&lt;Goma&gt;: <b>1</b></li><li>Kinshasa: 2</li>"
+
+    template = "@for(city in cities){{ city.name.upper() }}@endfor"
+    with pytest.raises(Exception) as exc_info:
+        parser.parse_directives(template, {"cities": [1]})
+    assert "city.name.upper()" in str(exc_info.value)
+
+
 def test_parse_auth_directive(mock_request):
     """Test parsing @auth directives."""
     parser = DirectiveParser()
@@ -432,6 +525,71 @@ def test_switch_with_expressions():
     assert "Multiple items" in result
 
 
+def test_switch_with_constant_and_variable_cases():
+    """Test switch mixing constant case values with values from the context."""
+    parser = DirectiveParser()
+    template = """
+    @switch(value)
+        @case(1)
+            One
+        @case(limit)
+            Limit
+        @case(3)
+            Three
+        @default
+            Other
+    @endswitch
+    """
+
+    assert "One" in parser.parse_directives(template, {"value": 1, "limit": 5})
+    assert "Limit" in parser.parse_directives(template, {"value": 5, "limit": 5})
+    assert "Three" in parser.parse_directives(template, {"value": 3, "limit": 5})
+    assert "Other" in parser.parse_directives(template, {"value": 7, "limit": 5})
+
+
+def test_switch_on_value_equal_to_a_constant_case():
+    """Test that a value equal to a constant case matches it, even when it doesn't hash like it."""
+
+    class Status:
+        def __init__(self, code):
+            self.code = code
+
+        def __eq__(self, other):
+            return self.code == other
+
+        def __hash__(self):
+            return hash(("status", self.code))
+
+    parser = DirectiveParser()
+    template = "@switch(value)@case(1)One@case(2)Two@default Other@endswitch"
+
+    assert parser.parse_directives(template, {"value": Status(2)}) == "Two"
+    assert parser.parse_directives(template, {"value": Status(3)}) == "Other"
+    assert parser.parse_directives(template, {"value": 1}) == "One"
+
+
+def test_switch_with_unhashable_cases():
+    """Test switch with case values that cannot be looked up in a table."""
+    parser = DirectiveParser()
+    template = """
+    @switch(pair)
+        @case([1, 2])
+            First pair
+        @case([3, 4])
+            Second pair
+        @default
+            Unknown pair
+    @endswitch
+    """
+
+    result = parser.parse_directives(template, {"pair": [3, 4]})
+    assert "Second pair" in result
+    assert "First pair" not in result
+
+    result = parser.parse_directives(template, {"pair": [5, 6]})
+    assert "Unknown pair" in result
+
+
 def test_nested_switch_in_if():
     """Test switch directive nested inside if directive."""
     parser = DirectiveParser()
@@ -494,6 +652,26 @@ def test_unclosed_tags():
     assert "Unclosed @for directive at line 2" in str(exc_info.value)
 
 
+def test_mismatched_end_tags():
+    """Test error handling for closing directives that do not match the open block."""
+    parser = DirectiveParser()
+
+    template = """
+    @if(True)
+        Content
+    @endfor
+    """
+    with pytest.raises(DirectiveParsingError) as exc_info:
+        parser.parse_directives(template, {})
+    assert "Mismatched @endfor at line 4" in str(exc_info.value)
+    assert "@endif for the @if directive at line 2" in str(exc_info.value)
+
+    template = "Content @endif"
+    with pytest.raises(DirectiveParsingError) as exc_info:
+        parser.parse_directives(template, {})
+    assert "no open @if directive" in str(exc_info.value)
+
+
 def test_switch_error_handling():
     """Test error handling in switch directives."""
     parser = DirectiveParser()
@@ -839,6 +1017,37 @@ def test_class_directive():
     assert 'new-item' not in result
 
 
+def test_constant_class_and_style_directives():
+    """Test @class and @style directives whose conditions are all constants."""
+    parser = DirectiveParser()
+
+    template = '<div @class({"active": True, "hidden": False, "wide": 2 > 1})>Test</div>'
+    result = parser.parse_directives(template, {})
+    assert result == '<div  class="active wide">Test</div>'
+
+    template = '<div @style({"color: red": True, "display: none": False})>Test</div>'
+    result = parser.parse_directives(template, {})
+    assert result == '<div  style="color: red;">Test</div>'
+
+    template = '<div @class({"active": False})>Test</div>'
+    result = parser.parse_directives(template, {})
+    assert result == "<div >Test</div>"
+
+
+def test_constant_conditions_within_limits():
+    """Test that only bounded constant expressions are evaluated at compile time, and names come from the context."""
+    parser = DirectiveParser()
+
+    template = "@if(x)a@elif(9 ** 9 ** 9)b@elif('a' * 10 ** 10)c@endif"
+    assert parser.parse_directives(template, {"x": 1}) == "a"
+
+    template = "@if(2 ** 10 > 1000)big@endif"
+    assert parser.parse_directives(template, {}) == "big"
+
+    template = "@if(pi)circle@else square@endif"
+    assert parser.parse_directives(template, {"pi": 0}) == "square"
+
+
 def test_class_directive_errors():
     """Test error handling in @class directive."""
     parser = DirectiveParser()
@@ -1019,3 +1228,86 @@ def test_field_directive_errors():
         template = '@field(form.field, class=form-control)'  # Missing quotes
         parser.parse_directives(template, {'form': forms.Form()})
     assert "Error in @field directive" in str(exc.value)
+
+
+def test_inline_directives_in_long_template():
+    """Test that inline directives are found in long templates, among other uses of "@"."""
+    parser = DirectiveParser()
+    text = "<p>Write to contact@example.com</p>\n" * 50
+    template = f"{text}@widthratio(5, 10, 100)%{text}"
+
+    result = parser.parse_directives(template, {})
+    assert result == f"{text}50%{text}"
+
+
+def test_conditional_attribute_directives():
+    """Test the boolean attribute directives, with and without a condition."""
+    parser = DirectiveParser()
+    template = "<input @checked(a) @required @disabled(b) @autocomplete(a) @autocomplete(b)>"
+
+    result = parser.parse_directives(template, {"a": [1], "b": 0})
+    assert result == "<input checked required on off>"
+
+
+def test_with_directive():
+    """Test that @with defines a variable for its content only, shadowing the context."""
+    parser = DirectiveParser()
+    template = "@with(user.upper() as name)<p>{{ name }} {{ title }}</p>@endwith"
+    context = {"user": "ann", "name": "outer", "title": "Dr"}
+
+    result = parser.parse_directives(template, context)
+    assert result == "<p>ANN Dr</p>"
+    assert context["name"] == "outer"
+
+
+def test_firstof_directive():
+    """Test that @firstof outputs its first non-empty value, without evaluating the following ones."""
+    parser = DirectiveParser()
+    calls = []
+
+    class Tracker:
+        @property
+        def value(self):
+            calls.append(1)
+            return "tracked"
+
+    context = {"empty": "", "name": "Ann", "tracker": Tracker()}
+
+    result = parser.parse_directives("@firstof(empty, name, tracker.value)", context)
+    assert result == "Ann"
+    assert calls == []
+
+    result = parser.parse_directives("@firstof(empty, undefined_var, 'Anonymous')", context)
+    assert result == "Anonymous"
+
+    result = parser.parse_directives("@firstof(empty, 0, default=none)", context)
+    assert result == "none"
+
+
+def test_cycle_directive():
+    """Test that each @cycle directive steps through its own values."""
+    parser = DirectiveParser()
+    template = "@for(item in items)<tr class='@cycle(\"odd\", \"even\")'>@cycle('a', 'b', 'c')</tr>@endfor"
+    context = {"items": [1, 2, 3, 4]}
+
+    result = parser.parse_directives(template, context)
+    assert result == (
+        "<tr class='odd'>a</tr><tr class='even'>b</tr><tr class='odd'>c</tr><tr class='even'>a</tr>"
+    )
+
+
+def test_querystring_directive(mock_request):
+    """Test that each @querystring directive updates the current query string on its own."""
+
+    class MockQueryDict:
+        def urlencode(self):
+            return "page=1&sort=asc&tag=a&tag=b"
+
+    mock_request.GET = MockQueryDict()
+    parser = DirectiveParser()
+    template = "@querystring(page=2)|@querystring(sort=None, page='3')|@querystring"
+
+    result = parser.parse_directives(template, {"request": mock_request})
+    assert result == (
+        "?page=2&sort=asc&tag=a&tag=b|?page=3&tag=a&tag=b|?page=1&sort=asc&tag=a&tag=b"
+    )
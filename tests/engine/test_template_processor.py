@@ -24,6 +24,16 @@ def test_render_with_html_escaping():
     assert result == "&lt;script&gt;alert(&#x27;xss&#x27;)&lt;/script&gt;"
 
 
+def test_render_escapes_every_html_character():
+    """Test that each character html.escape handles is escaped, and other text is left as is."""
+    processor = TemplateProcessor()
+    template = "{{ a }}|{{ b }}|{{ c }}|{{ d }}|{{ e }}|{{ f }}"
+    context = {"a": "&", "b": "<", "c": ">", "d": '"', "e": "'", "f": "plain text"}
+
+    result = processor.render(template, context)
+    assert result == "&amp;|&lt;|&gt;|&quot;|&#x27;|plain text"
+
+
 def test_render_with_unescaped_html():
     """Test that HTML can be rendered unescaped when explicitly requested."""
     processor = TemplateProcessor()
@@ -34,6 +44,16 @@ def test_render_with_unescaped_html():
     assert result == "<strong>bold</strong>"
 
 
+def test_render_does_not_parse_variable_output():
+    """Test that the output of a variable is not parsed as another variable."""
+    processor = TemplateProcessor()
+    template = "{{ comment }}"
+    context = {"comment": "{!! secret !!}", "secret": "password"}
+
+    result = processor.render(template, context)
+    assert result == "{!! secret !!}"
+
+
 def test_render_with_conditional():
     """Test rendering with @if directive."""
     processor = TemplateProcessor()
@@ -66,6 +86,35 @@ def test_render_with_nested_variables():
     assert result == "John"
 
 
+def test_render_reuses_compiled_variables():
+    """Test that the variables of a template render correctly with each context, whatever its directives output."""
+    processor = TemplateProcessor()
+    template = "@if(show)<b>{{ name }}</b>@endif{{ name }}!"
+
+    assert processor.render(template, {"show": True, "name": "a"}) == "<b>a</b>a!"
+    assert processor.render(template, {"show": True, "name": "b"}) == "<b>b</b>b!"
+    assert processor.render(template, {"show": False, "name": "c"}) == "c!"
+    assert processor.render(template, {"show": True, "name": "d"}) == "<b>d</b>d!"
+
+
+def test_processors_render_the_same_template():
+    """Test that processors rendering the same template each get their own output."""
+    first, second = TemplateProcessor(), TemplateProcessor()
+    template = "@if(show)<b>{{ name }}</b>@endif{{ name }}"
+
+    assert first.render(template, {"show": True, "name": "a"}) == "<b>a</b>a"
+    assert second.render(template, {"show": False, "name": "b"}) == "b"
+    assert first.render(template, {"show": True, "name": "c"}) == "<b>c</b>c"
+
+
+def test_render_props_defaults_are_not_shared():
+    """Test that renders modifying a mutable @props default don't see each other's changes."""
+    template = "@props({'items': []}){{ items.append(1) }}{{ items }}"
+
+    for _ in range(3):
+        assert TemplateProcessor().render(template, {}) == "None[1]"
+
+
 def test_render_with_undefined_variable():
     """Test that undefined variables raise an error."""
     processor = TemplateProcessor()